@@ -0,0 +1,474 @@
+#
+# bench.py - Benchmarks of the players' hot paths and of descender/nnet.py.
+#
+# Drives each player's get_move through a scripted view of a fixed, seeded
+# plant field, at several board sizes (BOUNDS) where the player has one, and
+# times descender's density updates and searches, network classification
+# throughput, and dataset parsing.  Results can be saved as a JSON baseline,
+# and a later run compared against it:
+#
+#   python bench.py --save baseline.json
+#   python bench.py --compare baseline.json
+#
+# which flags every metric that got worse by more than --tolerance and exits
+# with status 1 if there are any.  On a machine whose speed drifts from one
+# run to the next, --normalize compares each metric against the median change
+# of all of them instead.
+#
+
+import gc
+import imp
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import rg
+from rg import game_interface
+from descender import nnet
+
+PLAYERS = ['descender', 'camera', 'explorer', 'player', 'dummy']
+BASELINE_VERSION = 1
+
+TEST_FILE = os.path.join(ROOT, 'data', 'plants2.dat')
+WEIGHTS_FILE = os.path.join(ROOT, 'descender', 'weights.out')
+
+
+########################################
+# Scripted view
+########################################
+
+FIELD_RADIUS = 40
+STARTING_LIFE = 100000
+PLANT_ODDS = [0.7, 0.2, 0.1]
+NIMAGES = 64
+
+STEPS = {
+    game_interface.UP: (0, 1),
+    game_interface.DOWN: (0, -1),
+    game_interface.LEFT: (-1, 0),
+    game_interface.RIGHT: (1, 0),
+}
+
+class ScriptedView:
+    # Stands in for a game_interface player view.  The field, the images and
+    # so every game are fixed by the seed, and only this player moves: the
+    # caller plays each returned move with step().
+    def __init__(self, seed, life=STARTING_LIFE):
+        rng = np.random.RandomState(seed)
+        width = 2*FIELD_RADIUS + 1
+        self.plants = rng.choice([game_interface.STATUS_NO_PLANT,
+                                  game_interface.STATUS_NUTRITIOUS_PLANT,
+                                  game_interface.STATUS_POISONOUS_PLANT],
+                                 size=(width, width), p=PLANT_ODDS)
+        self.images = rng.randint(0, 2, (NIMAGES, nnet.IMGSIZE)).tolist()
+        self.eaten = np.zeros((width, width), dtype=bool)
+
+        self.x, self.y = 0, 0
+        self.life = life
+        self.round = 0
+        self.nimages = 0
+
+    def plant(self):
+        (i, j) = (self.x + FIELD_RADIUS, self.y + FIELD_RADIUS)
+        if not (0 <= i < len(self.plants) and 0 <= j < len(self.plants)):
+            return (game_interface.STATUS_NO_PLANT, None)
+        return (self.plants[i, j], (i, j))
+
+    def GetXPos(self):
+        return self.x
+
+    def GetYPos(self):
+        return self.y
+
+    def GetLife(self):
+        return self.life
+
+    def GetRound(self):
+        return self.round
+
+    def GetPlantInfo(self):
+        (plant, ij) = self.plant()
+        if plant == game_interface.STATUS_NO_PLANT or self.eaten[ij]:
+            return plant
+        return game_interface.STATUS_UNKNOWN_PLANT
+
+    def GetImage(self):
+        self.life -= 1
+        self.nimages += 1
+        return list(self.images[self.nimages % NIMAGES])
+
+    def step(self, move, eat):
+        (plant, ij) = self.plant()
+        if eat and ij is not None and not self.eaten[ij]:
+            if plant == game_interface.STATUS_NUTRITIOUS_PLANT:
+                self.life += 20
+            elif plant == game_interface.STATUS_POISONOUS_PLANT:
+                self.life -= 10
+            if plant != game_interface.STATUS_NO_PLANT:
+                self.eaten[ij] = True
+
+        (dx, dy) = STEPS.get(move, (0, 0))
+        self.x, self.y = self.x + dx, self.y + dy
+        self.life -= 1
+        self.round += 1
+
+
+########################################
+# Player loading
+########################################
+
+BOUNDS_RE = re.compile(r'^BOUNDS = \d+', re.M)
+
+def has_bounds(name):
+    with open(os.path.join(ROOT, name, 'player.py')) as f:
+        return BOUNDS_RE.search(f.read()) is not None
+
+def load_player(name, bounds=None):
+    # A private copy of name.player, with its BOUNDS set to bounds.  Players
+    # size their boards at import, so this re-executes the module's code.
+    path = os.path.join(ROOT, name, 'player.py')
+    with open(path) as f:
+        source = f.read()
+    if bounds is not None:
+        source = BOUNDS_RE.sub('BOUNDS = %d' % bounds, source)
+
+    # Load the copy inside the player's package, so that its imports of
+    # sibling modules still work.
+    __import__(name)
+    modname = '%s._bench_player_%s' % (name, bounds)
+    module = imp.new_module(modname)
+    module.__file__ = path
+    sys.modules[modname] = module
+    exec compile(source, path, 'exec') in module.__dict__
+    return module
+
+
+########################################
+# Benchmarks
+########################################
+
+def metric(results, name, value, unit, better='lower', noise=0.0):
+    results[name] = {'value': value, 'unit': unit, 'better': better,
+                     'noise': noise}
+
+# Every timing is the best of several repeats after an untimed warm-up, since
+# single runs vary far more from one run to the next than the changes worth
+# flagging.  How far the median repeat is from the best one is kept as the
+# metric's noise: a change smaller than that is not flagged.  Timings of
+# single calls are also only good to one tick of the clock.  Throughput
+# timings call fn() often enough to take at least MIN_TIME seconds each.
+MIN_TIME = 0.1
+
+def clock_tick():
+    # The smallest step seen in timeit.default_timer().
+    ticks = []
+    for _ in xrange(10):
+        start = now = timeit.default_timer()
+        while now == start:
+            now = timeit.default_timer()
+        ticks.append(now - start)
+    return min(ticks)
+
+TICK = clock_tick()
+
+def spread(values):
+    # The best of values, and how far their median is from it.
+    values = sorted(values)
+    return (values[0], values[len(values) // 2] - values[0])
+
+def best_of(repeat, fn):
+    # Shortest time per call of fn() over repeat timings, and its noise.
+    number = 1
+    while timeit.timeit(fn, number=number) < MIN_TIME:
+        number *= 2
+    (best, noise) = spread(timeit.repeat(fn, number=number, repeat=repeat))
+    return (best / number, noise / number)
+
+def best_stats(repeat, run):
+    # The smallest of each statistic returned by run() over the repeats, with
+    # its noise.  Like timeit, keep the garbage collector out of the timings.
+    run()
+    runs = []
+    for _ in xrange(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            runs.append(run())
+        finally:
+            gc.enable()
+    return [(best, max(noise, TICK))
+            for (best, noise) in map(spread, zip(*runs))]
+
+def rate(count, (secs, noise)):
+    # count / secs, and the noise of that.
+    return (count / secs, count / secs - count / (secs + noise))
+
+def play_games(name, bounds, options):
+    # Latencies of every move of options.games scripted games, played by a
+    # fresh copy of the player.
+    player = load_player(name, bounds)
+    latencies = []
+
+    for game in xrange(options.games):
+        if game and hasattr(player, 'reset'):
+            player.reset()
+        random.seed(game)
+        view = ScriptedView(game)
+
+        for _ in xrange(options.moves):
+            if hasattr(player, 'best_move'):
+                player.best_move, player.deadline = None, None
+
+            start = timeit.default_timer()
+            try:
+                (move, eat) = player.get_move(view)
+            except SystemExit:
+                # Collectors quit once they have swept their board.
+                break
+            latencies.append(timeit.default_timer() - start)
+            view.step(move, eat)
+
+    latencies.sort()
+    return (np.mean(latencies), rg.percentile(latencies, 50),
+            rg.percentile(latencies, 95))
+
+def bench_moves(results, name, bounds, options):
+    stats = best_stats(options.repeat,
+                       lambda: play_games(name, bounds, options))
+
+    key = 'get_move/%s' % name
+    if bounds is not None:
+        key += '/bounds=%d' % bounds
+    for (stat, (value, noise)) in zip(['mean', 'p50', 'p95'], stats):
+        metric(results, '%s/%s_ms' % (key, stat), 1e3 * value, 'ms',
+               noise=1e3 * noise)
+
+def bench_density(results, bounds, options):
+    # descender's density upkeep: update_density() at fresh cells, each
+    # followed by a densest_pos() search of the changed map.
+    player = load_player('descender', bounds)
+    rng = random.Random(0)
+    cells = list(player.GRID)
+    rng.shuffle(cells)
+    cells = cells[:options.moves]
+    plants = [rng.choice('.NP') for _ in cells]
+    probes = [rng.choice(player.GRID) for _ in cells]
+
+    def run():
+        update, search = [], []
+        player.reset()
+        for (pos, plant, probe) in zip(cells, plants, probes):
+            start = timeit.default_timer()
+            player.update_density(pos, plant)
+            middle = timeit.default_timer()
+            player.densest_pos(probe)
+            end = timeit.default_timer()
+            update.append(middle - start)
+            search.append(end - middle)
+        return (np.median(update), np.median(search))
+
+    ((update, update_noise), (search, search_noise)) = \
+        best_stats(options.repeat, run)
+    key = 'density/bounds=%d' % bounds
+    metric(results, key + '/update_density_us', 1e6 * update, 'us',
+           noise=1e6 * update_noise)
+    metric(results, key + '/densest_pos_us', 1e6 * search, 'us',
+           noise=1e6 * search_noise)
+
+def bench_nnet(results, options):
+    (inputs, targets) = nnet.file_get_set(TEST_FILE, -1)
+    examples = nnet.file_get_examples(TEST_FILE, -1)
+    n = min(len(inputs), options.moves * 10)
+
+    network = nnet.MatrixNeuralNetwork.Import(WEIGHTS_FILE)
+    rows = list(inputs[:n])
+    (value, noise) = rate(n, best_of(options.repeat,
+        lambda: [network.confidence(row, 1) for row in rows]))
+    metric(results, 'nnet/matrix/confidence_per_s', value, 'calls/s',
+           'higher', noise)
+    (value, noise) = rate(len(inputs), best_of(options.repeat,
+        lambda: network.performance((inputs, targets))))
+    metric(results, 'nnet/matrix/performance_examples_per_s', value,
+           'examples/s', 'higher', noise)
+
+    # The object-graph network is much slower; give it fewer examples.
+    network = nnet.NeuralNetwork.Import(WEIGHTS_FILE)
+    few = examples[:max(n // 10, 1)]
+    (value, noise) = rate(len(few), best_of(options.repeat,
+        lambda: [network.confidence(ex.input, 1) for ex in few]))
+    metric(results, 'nnet/graph/confidence_per_s', value, 'calls/s',
+           'higher', noise)
+    (value, noise) = rate(len(few), best_of(options.repeat,
+        lambda: network.performance(few)))
+    metric(results, 'nnet/graph/performance_examples_per_s', value,
+           'examples/s', 'higher', noise)
+
+def bench_parse(results, options):
+    count = len(nnet.file_get_examples(TEST_FILE, -1))
+    (value, noise) = rate(count, best_of(options.repeat,
+        lambda: nnet.file_get_examples(TEST_FILE, -1)))
+    metric(results, 'parse/file_get_examples_per_s', value, 'examples/s',
+           'higher', noise)
+    (value, noise) = rate(count, best_of(options.repeat,
+        lambda: nnet.file_parse_examples(TEST_FILE, -1)))
+    metric(results, 'parse/file_parse_examples_per_s', value, 'examples/s',
+           'higher', noise)
+
+def run(options):
+    results = {}
+    sections = re.compile(options.only) if options.only else None
+
+    def wanted(section):
+        return sections is None or sections.search(section)
+
+    # Players write their own files (camera's plant images, weights caches)
+    # into the working directory; keep them out of the tree.
+    cwd, scratch = os.getcwd(), tempfile.mkdtemp()
+    os.chdir(scratch)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        if wanted('get_move'):
+            for name in options.players:
+                for bounds in (options.bounds if has_bounds(name) else [None]):
+                    bench_moves(results, name, bounds, options)
+        if wanted('density'):
+            for bounds in options.bounds:
+                bench_density(results, bounds, options)
+        if wanted('nnet'):
+            bench_nnet(results, options)
+        if wanted('parse'):
+            bench_parse(results, options)
+    finally:
+        sys.stdout = stdout
+        for name in sys.modules.keys():
+            if name.endswith('.sink') and sys.modules[name] is not None:
+                sys.modules[name].close_all()
+        os.chdir(cwd)
+        shutil.rmtree(scratch)
+
+    return results
+
+
+########################################
+# Baselines
+########################################
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump({'version': BASELINE_VERSION,
+                   'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'metrics': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def load(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError('%s: unsupported baseline version' % path)
+    return baseline['metrics']
+
+def slowdown(new, old):
+    # How many times worse new is than old.
+    if new['better'] == 'higher':
+        return old['value'] / new['value']
+    return new['value'] / old['value']
+
+def report(results, baseline=None, tolerance=0.0, normalize=False):
+    # Print every metric, and against a baseline, its change; return the
+    # names of the metrics that regressed by more than tolerance.  Whole runs
+    # also get faster or slower with the load on the machine; with normalize,
+    # the median slowdown over all metrics is taken as that and divided out.
+    regressions = []
+    baseline = baseline or {}
+    pairs = dict((name, (results[name], baseline[name])) for name in results
+                 if name in baseline and baseline[name]['value'] and
+                 results[name]['value'])
+    shift = np.median([slowdown(new, old) for (new, old) in pairs.values()]) \
+            if pairs else 1.0
+
+    for name in sorted(results):
+        new = results[name]
+        line = '%-52s %12.4g %-11s' % (name, new['value'], new['unit'])
+
+        if name in pairs:
+            old = pairs[name][1]
+            factor = slowdown(new, old)
+            line += ' %12.4g  %+7.1f%%' % (old['value'], 100 * (factor - 1))
+            if normalize:
+                factor /= shift
+            # Changes within either run's noise aren't telling, whatever
+            # their relative size.
+            noise = max(new.get('noise', 0.0), old.get('noise', 0.0))
+            if factor - 1 > tolerance and \
+                    abs(factor - 1) * min(new['value'], old['value']) > noise:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print line
+
+    if pairs:
+        print 'median change: %+.1f%%%s' % (100 * (shift - 1),
+            ' (divided out)' if normalize else '')
+    return regressions
+
+def int_list(option, opt, value, parser):
+    setattr(parser.values, option.dest, [int(n) for n in value.split(',')])
+
+def main(argv):
+    parser = OptionParser(usage="Usage: python bench.py [options]")
+    parser.add_option("--players", dest="players", default=','.join(PLAYERS),
+                      help="comma-separated player packages to time")
+    parser.add_option("--bounds", dest="bounds", default=[8, 15, 25],
+                      type=str, action="callback", callback=int_list,
+                      help="comma-separated BOUNDS to time players at")
+    parser.add_option("--moves", dest="moves", default=200, type=int,
+                      help="moves per game, and density updates per run")
+    parser.add_option("--games", dest="games", default=3, type=int,
+                      help="games per player and board size")
+    parser.add_option("--repeat", dest="repeat", default=5, type=int,
+                      help="repetitions of each measurement; the best counts")
+    parser.add_option("--only", dest="only", default=None,
+                      help="regexp of the sections to run: get_move, "
+                           "density, nnet, parse")
+    parser.add_option("--save", dest="save", default=None,
+                      help="write the results to this JSON baseline")
+    parser.add_option("--compare", dest="compare", default=None,
+                      help="compare the results against this baseline")
+    parser.add_option("--tolerance", dest="tolerance", default=0.5,
+                      type=float, help="allowed relative slowdown")
+    parser.add_option("--normalize", action="store_true", dest="normalize",
+                      default=False, help="compare against the median change "
+                                          "of all metrics, for machines whose "
+                                          "speed drifts between runs")
+    (options, args) = parser.parse_args(argv[1:])
+
+    options.players = options.players.split(',')
+    baseline = load(options.compare) if options.compare else None
+
+    results = run(options)
+    regressions = report(results, baseline, options.tolerance,
+                         options.normalize)
+    if options.save:
+        save(options.save, results)
+
+    if regressions:
+        print '%d regression(s) beyond %.0f%%' % (len(regressions),
+                                                  100 * options.tolerance)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
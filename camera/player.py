@@ -1,7 +1,7 @@
 import sys
 import time
-from itertools import *
 import game_interface
+import sink
 
 BOUNDS = 20
 NIMGS = 20
@@ -10,11 +10,25 @@ plants = []
 life, prev_life = 100, 100
 target = (-BOUNDS, -BOUNDS)
 
-f = open('plants.dat', 'a')
+# Collected images go to BINARY_FILE, and to the legacy text format in
+# TEXT_FILE unless it is None.
+BINARY_FILE = 'plants.bin'
+TEXT_FILE = 'plants.dat'
 
-def grouper(iterable, n, fillvalue=None):
-    args = [iter(iterable)] * n
-    return izip_longest(*args, fillvalue=fillvalue)
+f = sink.SampleSink(BINARY_FILE, TEXT_FILE)
+
+# Start a new game; rg.py calls this between the games a process plays.
+# Images of the last game are already in the sink, which stays open.
+def reset():
+    global life, prev_life, target
+    del plants[:]
+    life, prev_life = 100, 100
+    target = (-BOUNDS, -BOUNDS)
+
+# End a game; rg.py calls this after every game a batch worker plays, since
+# workers exit without running the sink's atexit hook.
+def finish():
+    f.flush()
 
 def next_target((x, y)):
     if y == BOUNDS:
@@ -45,11 +59,7 @@ def get_move(view):
     if plants:
         nutritious = life > prev_life
 
-        for plant in plants:
-            image = '\n'.join([' '.join(row) for row in plant])
-            f.write('#%d\n' % nutritious)
-            f.write('%s\n' % image)
-
+        f.add(nutritious, plants)
         plants = []
 
     # If we've swept the board, abort.
@@ -60,8 +70,7 @@ def get_move(view):
     if pos == target:
         if has_plant:
             for _ in xrange(NIMGS):
-                image = [str(px) for px in view.GetImage()]
-                plants.append(grouper(image, 6))
+                plants.append(view.GetImage())
         target = next_target(target)
 
     # Decide where to move next.
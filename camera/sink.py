@@ -0,0 +1,147 @@
+#
+# sink.py - Buffered, binary sink for collected plant images.
+#
+# Samples are copied into a preallocated record array, which a background
+# thread writes out every FLUSH_INTERVAL seconds; if the buffer fills up in
+# between, add() writes it out itself.  The binary file is a dataset of
+# descender/nnet.py: a 16-byte header followed by records of one label byte
+# and IMGSIZE pixel bytes.  The legacy text format can be written alongside.
+#
+
+import atexit
+import os
+import threading
+import numpy as np
+
+from descender.nnet import (IMGSIZE, DATASET_MAGIC, DATASET_VERSION,
+                            DATASET_HEADER, DATASET_RECORD)
+
+ROWSIZE = 6
+
+CAPACITY = 4096
+FLUSH_INTERVAL = 1.0
+
+open_sinks = []
+
+def open_dataset(path):
+    # Open a binary dataset for appending, writing its header if it is new.
+    # A partial record at the end, e.g., from a collector that was killed
+    # mid-write, is cut off so that new records stay aligned.
+    f = open(path, 'ab')
+    size = f.tell()
+    if size == 0:
+        f.write(DATASET_HEADER.pack(DATASET_MAGIC, DATASET_VERSION, IMGSIZE))
+        f.flush()
+        return f
+
+    with open(path, 'rb') as existing:
+        header = existing.read(DATASET_HEADER.size)
+    if len(header) < DATASET_HEADER.size or \
+            DATASET_HEADER.unpack(header) != (DATASET_MAGIC, DATASET_VERSION,
+                                              IMGSIZE):
+        f.close()
+        raise ValueError('%s: not a binary plant dataset' % path)
+
+    extra = (size - DATASET_HEADER.size) % DATASET_RECORD.itemsize
+    if extra:
+        f.truncate(size - extra)
+        f.seek(0, os.SEEK_END)
+    return f
+
+def close_all():
+    # For processes that end without running atexit hooks, e.g., pool workers.
+    while open_sinks:
+        open_sinks.pop().close()
+
+class SampleSink:
+    def __init__(self, path, text_path=None, capacity=CAPACITY,
+                 interval=FLUSH_INTERVAL):
+        self.path = path
+        self.text_path = text_path
+        self.interval = interval
+
+        # Two buffers: one being filled while the other is being written.
+        self.buffers = [np.empty(capacity, dtype=DATASET_RECORD)
+                        for _ in xrange(2)]
+        self.count = 0
+
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+
+        self.binary = open_dataset(path)
+        self.text = open(text_path, 'a') if text_path else None
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+        # Players end the game with sys.exit(); make sure nothing is lost.
+        atexit.register(self.close)
+        open_sinks.append(self)
+
+    def add(self, label, images):
+        # Queue len(images) samples, all with the same label.
+        images = np.asarray(images, dtype=np.uint8).reshape(-1, IMGSIZE)
+        capacity = len(self.buffers[0])
+
+        for start in xrange(0, len(images), capacity):
+            chunk = images[start:start + capacity]
+
+            while True:
+                with self.lock:
+                    if self.count + len(chunk) <= capacity:
+                        records = self.buffers[0][self.count:
+                                                  self.count + len(chunk)]
+                        records['label'] = label
+                        records['pixels'] = chunk
+                        self.count += len(chunk)
+                        break
+
+                # Out of room; write out the buffer ourselves.
+                self.flush()
+
+    def flush(self):
+        # Swap buffers under the lock, but write outside of it, so that add()
+        # only ever waits on a write when its buffer is full.
+        with self.write_lock:
+            with self.lock:
+                (full, n) = (self.buffers[0], self.count)
+                self.buffers.reverse()
+                self.count = 0
+            self.write(full[:n])
+
+    def write(self, records):
+        if len(records) == 0:
+            return
+        self.binary.write(records.tostring())
+        self.binary.flush()
+
+        if self.text:
+            lines = []
+            for record in records:
+                lines.append('#%d\n' % record['label'])
+                for row in record['pixels'].reshape(-1, ROWSIZE):
+                    lines.append(' '.join(str(px) for px in row) + '\n')
+            self.text.write(''.join(lines))
+            self.text.flush()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if not self.closed:
+                self.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+
+        self.flush()
+        self.binary.close()
+        if self.text:
+            self.text.close()
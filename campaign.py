@@ -0,0 +1,193 @@
+#
+# campaign.py - Parallel, sharded data-collection campaigns.
+#
+# Plays many seeded games of a collecting player (camera by default) against
+# an idle opponent on a process pool.  Each game runs in its own shard
+# directory, where the collector writes its plants.bin.  Once all games are
+# done, the shards are merged, duplicate plants are dropped, and the plants
+# are shuffled with a fixed seed and split into plants0/1/2.dat training,
+# validation and test sets (each with its binary copy, see descender/nnet.py).
+#
+
+import glob
+import importlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import time
+import numpy as np
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import rg
+from descender import nnet
+
+SHARD_FILE = 'plants.bin'
+SPLIT_FILES = ['plants0.dat', 'plants1.dat', 'plants2.dat']
+
+def shard_dir(options, seed):
+    return os.path.join(options.out, 'shards', 'shard-%06d' % seed)
+
+def collect((options, seed)):
+    # Runs in a fresh worker process, so the collector's module state (and
+    # its output files, opened at import) belong to this game alone.
+    sys.stdout = open(os.devnull, 'w')
+
+    shard = shard_dir(options, seed)
+    if not os.path.isdir(shard):
+        os.makedirs(shard)
+    os.chdir(shard)
+
+    random.seed(seed)
+    (collector, opponent) = rg.load_players(options)
+    sink = importlib.import_module(options.player1 + '.sink')
+
+    start = time.time()
+    try:
+        rg.play(rg.new_game(options, seed), collector, opponent, options)
+    except SystemExit:
+        # Collectors quit once they have swept the board.
+        pass
+    finally:
+        sink.close_all()
+
+    return (seed, time.time() - start)
+
+def read_shards(options):
+    # (path, labels, pixels) of every shard.
+    shards = []
+    for path in sorted(glob.glob(os.path.join(options.out, 'shards', '*',
+                                              SHARD_FILE))):
+        (l, p) = nnet.open_dataset(path)
+        shards.append((path, np.array(l), np.array(p)))
+    return shards
+
+def group_plants(path, labels, pixels, group):
+    # A shard's images as plants of `group` images each.  A shard that does
+    # not split evenly into plants of one label each would shift every plant
+    # after the fault, so it is refused.
+    if len(labels) % group:
+        raise ValueError('%s: %d images are not whole plants of %d' %
+                         (path, len(labels), group))
+    labels = labels.reshape(-1, group)
+    pixels = pixels.reshape(-1, group, nnet.IMGSIZE)
+    if np.any(labels != labels[:, :1]):
+        raise ValueError('%s: plants of %d images with mixed labels' %
+                         (path, group))
+    return labels, pixels
+
+def dedupe(shards, group):
+    # Merge the shards, dropping repeated plants, i.e., runs of `group`
+    # images with identical labels and pixels.  Single images can
+    # legitimately repeat.
+    plants = [group_plants(path, l, p, group) for (path, l, p) in shards]
+    if not plants:
+        return (np.empty((0, group), dtype=np.uint8),
+                np.empty((0, group, nnet.IMGSIZE), dtype=np.uint8))
+    labels = np.concatenate([l for (l, p) in plants])
+    pixels = np.concatenate([p for (l, p) in plants])
+
+    seen, keep = set(), []
+    for i in xrange(len(labels)):
+        key = labels[i].tostring() + pixels[i].tostring()
+        if key not in seen:
+            seen.add(key)
+            keep.append(i)
+
+    return labels[keep], pixels[keep]
+
+def split(options, labels, pixels):
+    # Shuffle whole plants and cut them into the training, validation and
+    # test sets.
+    order = np.random.RandomState(options.split_seed).permutation(len(labels))
+    fractions = np.cumsum([0.0] + options.split)
+    cuts = (fractions / fractions[-1] * len(order)).astype(int)
+
+    for name, lo, hi in zip(SPLIT_FILES, cuts, cuts[1:]):
+        part = order[lo:hi]
+        path = os.path.join(options.out, name)
+        (l, p) = (labels[part].ravel(), pixels[part].reshape(-1, nnet.IMGSIZE))
+
+        nnet.write_text_dataset(path, l, p)
+        nnet.write_dataset(nnet.dataset_cache_path(path), l, p)
+        print '  %s: %d plants, %d images' % (path, len(part), len(l))
+
+def main(argv):
+    parser = OptionParser(usage="Usage: python campaign.py [options]")
+    parser.add_option("-n", "--games", dest="games", default=16, type=int,
+                      help="number of collection games")
+    parser.add_option("--seed", dest="seed", default=0, type=int,
+                      help="seed of the first game")
+    parser.add_option("-j", "--processes", dest="processes", default=None,
+                      type=int, help="number of worker processes")
+    parser.add_option("-o", "--out", dest="out", default="campaign",
+                      help="output directory")
+    parser.add_option("--collector", dest="player1", default="camera",
+                      help="package of the collecting player")
+    parser.add_option("--opponent", dest="player2", default="dummy",
+                      help="package of the opposing player")
+    parser.add_option("--group", dest="group", default=nnet.SAMPLES, type=int,
+                      help="images collected per plant")
+    parser.add_option("--split", dest="split", default="8,1,1",
+                      help="relative sizes of the train,valid,test sets")
+    parser.add_option("--split-seed", dest="split_seed", default=0, type=int,
+                      help="seed of the train/valid/test shuffle")
+    parser.add_option("--keep-shards", dest="keep_shards", action="store_true",
+                      default=False, help="keep the per-game shards")
+    parser.add_option("--starting_life", dest="starting_life", default=100000,
+                      type=int, help="starting life; enough to sweep the board")
+    parser.add_option("--plant_bonus", dest="plant_bonus", default=20, type=int)
+    parser.add_option("--plant_penalty", dest="plant_penalty", default=10,
+                      type=int)
+    parser.add_option("--observation_cost", dest="observation_cost", default=1,
+                      type=int)
+    parser.add_option("--life_per_turn", dest="life_per_turn", default=1,
+                      type=int)
+    parser.add_option("--deadline", dest="deadline", default=1.0, type=float)
+    parser.add_option("--simulate", action="store_true", dest="simulate",
+                      default=False, help="use the local game simulator")
+    (options, args) = parser.parse_args(argv[1:])
+
+    options.out = os.path.abspath(options.out)
+    options.split = [float(s) for s in options.split.split(',')]
+    options.display = 0
+    options.verbose = False
+    if len(options.split) != 3:
+        parser.error("--split takes three comma-separated sizes")
+    rg.use_engine(parser, options)
+    try:
+        importlib.import_module(options.player1 + '.sink')
+    except ImportError:
+        parser.error("collector %s has no sink module (%s/sink.py) to flush "
+                     "its images" % (options.player1, options.player1))
+
+    seeds = range(options.seed, options.seed + options.games)
+    pool = multiprocessing.Pool(options.processes, maxtasksperchild=1)
+
+    start = time.time()
+    try:
+        pool.map(collect, [(options, s) for s in seeds], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print 'Collected %d games in %.1fs' % (len(seeds), time.time() - start)
+
+    try:
+        (labels, pixels) = dedupe(read_shards(options), options.group)
+    except ValueError as e:
+        print 'Error: %s' % e
+        return 1
+    print 'Merged %d distinct plants' % len(labels)
+
+    split(options, labels, pixels)
+
+    if not options.keep_shards:
+        shutil.rmtree(os.path.join(options.out, 'shards'))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,260 @@
+#
+# clust.py - Cluster ALL the adults, at full dataset size.
+#
+# A NumPy port of clust.rb.  It reads the plant datasets through
+# descender/nnet.py and clusters the poisonous and nutritious images
+# separately with k-means, mini-batch k-means, or Autoclass EM.  Then it
+# classifies the test images by their nearest cluster mean.  Distances are
+# computed as whole matrices, one chunk of examples at a time.
+#
+
+import os
+import sys
+import numpy as np
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from descender import nnet
+
+USAGE = "Usage: python clust.py [options] kmeans|minibatch|autoclass"
+
+# Images per sample in the stratified lists, as in clust.rb.
+SAMPLES = 10
+
+# Examples per block of the distance matrix.
+CHUNK_SIZE = 8192
+
+
+###############################################################################
+#
+#  Utility routines.
+#
+
+def parse_input(fname, n):
+    # The first n images of a dataset as flat vectors, stratified by label:
+    # (poisonous, nutritious).
+    labels, pixels = nnet.file_get_dataset(fname, n)
+    return [np.array(pixels[labels == i], dtype=np.float64)
+            for i in xrange(nnet.NLABELS)]
+
+def sample_average(examples, ntake):
+    targets = np.zeros((len(examples), nnet.NLABELS))
+    return nnet.sample_reduce(examples, targets, SAMPLES, ntake)[0]
+
+def square_distances(x, means):
+    # |x_i - mu_k|^2 for every row of x and every mean.
+    d = (np.sum(x ** 2, axis=1)[:, np.newaxis] - 2 * np.dot(x, means.T) +
+         np.sum(means ** 2, axis=1)[np.newaxis, :])
+    return np.maximum(d, 0.0)
+
+def nearest_means(examples, means):
+    # Index of and square distance to the nearest mean of each example.
+    nearest = np.empty(len(examples), dtype=int)
+    dists = np.empty(len(examples))
+
+    for start in xrange(0, len(examples), CHUNK_SIZE):
+        d = square_distances(examples[start:start + CHUNK_SIZE], means)
+        nearest[start:start + len(d)] = np.argmin(d, axis=1)
+        dists[start:start + len(d)] = d[np.arange(len(d)),
+                                        nearest[start:start + len(d)]]
+    return nearest, dists
+
+def cluster_means(examples, assignment, ksize):
+    # Mean of each cluster; None for empty ones.
+    return [examples[assignment == k].mean(axis=0)
+            if np.any(assignment == k) else None for k in xrange(ksize)]
+
+def mean_squared_error(examples, assignment, ksize):
+    means = cluster_means(examples, assignment, ksize)
+    error = 0.0
+    for k, mu in enumerate(means):
+        if mu is not None:
+            error += np.sum((examples[assignment == k] - mu) ** 2)
+    return error / len(examples)
+
+
+###############################################################################
+#
+#  K-Means Clustering.
+#
+
+def k_means_cluster(examples, ksize, rng):
+    means = examples[rng.randint(len(examples), size=ksize)]
+    assignment = None
+
+    while True:
+        prev = assignment
+        assignment, _ = nearest_means(examples, means)
+
+        if prev is not None and np.array_equal(prev, assignment):
+            print 'MSE: %f' % mean_squared_error(examples, assignment, ksize)
+            return means
+
+        # Update means.  An empty cluster gets a random example instead.
+        means = np.array([mu if mu is not None
+                          else examples[rng.randint(len(examples))]
+                          for mu in cluster_means(examples, assignment,
+                                                  ksize)])
+
+def minibatch_k_means_cluster(examples, ksize, batch_size, iters, epsilon,
+                              rng):
+    # Mini-batch k-means: each step moves every mean towards the batch
+    # examples nearest to it, at a rate of one over the number of examples
+    # it has seen so far.
+    means = examples[rng.randint(len(examples), size=ksize)].copy()
+    counts = np.zeros(ksize)
+
+    for _ in xrange(iters):
+        batch = examples[rng.randint(len(examples), size=batch_size)]
+        nearest, _ = nearest_means(batch, means)
+        prev = means.copy()
+
+        for k in xrange(ksize):
+            members = batch[nearest == k]
+            if len(members):
+                counts[k] += len(members)
+                means[k] += (members.sum(axis=0) -
+                             len(members) * means[k]) / counts[k]
+
+        if np.max(np.abs(means - prev)) < epsilon:
+            break
+
+    assignment, _ = nearest_means(examples, means)
+    print 'MSE: %f' % mean_squared_error(examples, assignment, ksize)
+    return means
+
+
+###############################################################################
+#
+#  Autoclass Clustering.
+#
+
+def logsumexp(logs, axis=-1):
+    # ln(x_1 + ... + x_n) from [ln(x_1), ..., ln(x_n)], along axis.
+    ml = np.max(logs, axis=axis, keepdims=True)
+    return (ml + np.log(np.sum(np.exp(logs - ml), axis=axis,
+                               keepdims=True))).squeeze(axis)
+
+def autoclass_cluster(examples, ksize, epsilon, iters, rng):
+    features = (examples > 0.5).astype(np.float64)
+    (nexamples, dsize) = features.shape
+
+    # p(C = k), and p(X_d = 1 | C = k), kept away from 0 and 1 so that their
+    # logs stay finite.
+    theta_c = np.ones(ksize) / ksize
+    theta_attrs = rng.random_sample((ksize, dsize))
+    tiny = 1e-12
+
+    for _ in xrange(iters):
+        # E step: log of p(C = k) p(x_i | C = k), and the posteriors
+        # p(C = k | X = x_i).
+        t = np.clip(theta_attrs, tiny, 1 - tiny)
+        logp = (np.log(theta_c)[np.newaxis, :] +
+                np.dot(features, np.log(t).T) +
+                np.dot(1 - features, np.log(1 - t).T))
+        gamma = np.exp(logp - logsumexp(logp)[:, np.newaxis])
+
+        # M step.
+        n = np.maximum(gamma.sum(axis=0), tiny)
+        prev_c, prev_attrs = theta_c, theta_attrs
+        theta_c = n / nexamples
+        theta_attrs = np.dot(gamma.T, features) / n[:, np.newaxis]
+
+        if (np.max(np.abs(theta_c - prev_c)) < epsilon and
+                np.max(np.abs(theta_attrs - prev_attrs)) < epsilon):
+            break
+
+    # Choose clusters based on the maximum posterior.
+    assignment = np.argmax(gamma, axis=1)
+    print 'MSE: %f' % mean_squared_error(examples, assignment, ksize)
+
+    return np.array([mu if mu is not None else theta_attrs[k]
+                     for k, mu in enumerate(cluster_means(examples,
+                                                          assignment, ksize))])
+
+
+###############################################################################
+#
+#  Main routine.
+#
+
+def int_pair(option, opt, value, parser):
+    values = [int(v) for v in value.split(',')]
+    if len(values) != 2:
+        parser.error("Please provide two values for %s" % opt)
+    setattr(parser.values, option.dest, values)
+
+def main(argv):
+    parser = OptionParser(usage=USAGE)
+    parser.add_option("-f", "--inputfile", dest="file",
+                      default=os.path.join(ROOT, 'data', 'plants0.dat'),
+                      help="data file")
+    parser.add_option("-t", "--testfile", dest="test",
+                      default=os.path.join(ROOT, 'data', 'plants1.dat'),
+                      help="test file")
+    parser.add_option("-k", "--num-clusters", dest="k", default=[3, 1],
+                      type=str, action="callback", callback=int_pair,
+                      help="number of clusters K0,K1")
+    parser.add_option("-n", "--num-examples", dest="n", default=-1, type=int,
+                      help="number of examples (default: all)")
+    parser.add_option("-e", "--epsilon", dest="eps", default=0.000001,
+                      type=float, help="convergence epsilon")
+    parser.add_option("-s", "--sample-size", dest="samps", default=None,
+                      type=str, action="callback", callback=int_pair,
+                      help="average S0,S1 from each sample")
+    parser.add_option("-b", "--batch-size", dest="batch_size", default=1000,
+                      type=int, help="mini-batch size")
+    parser.add_option("-i", "--iterations", dest="iters", default=1000,
+                      type=int, help="maximum mini-batch or EM iterations")
+    parser.add_option("--seed", dest="seed", default=None, type=int,
+                      help="random seed")
+    (options, args) = parser.parse_args(argv[1:])
+
+    if not args:
+        parser.error(USAGE)
+    rng = np.random.RandomState(options.seed)
+
+    # Extract plant images.
+    poisonous, nutritious = parse_input(options.file, options.n)
+    ptest, ntest = parse_input(options.test, options.n)
+
+    if options.samps is not None:
+        poisonous = sample_average(poisonous, options.samps[0])
+        nutritious = sample_average(nutritious, options.samps[0])
+        ptest = sample_average(ptest, options.samps[1])
+        ntest = sample_average(ntest, options.samps[1])
+
+    if args[0] == 'kmeans':
+        pmeans = k_means_cluster(poisonous, options.k[0], rng)
+        nmeans = k_means_cluster(nutritious, options.k[1], rng)
+    elif args[0] == 'minibatch':
+        pmeans = minibatch_k_means_cluster(poisonous, options.k[0],
+                                           options.batch_size, options.iters,
+                                           options.eps, rng)
+        nmeans = minibatch_k_means_cluster(nutritious, options.k[1],
+                                           options.batch_size, options.iters,
+                                           options.eps, rng)
+    elif args[0] == 'autoclass':
+        pmeans = autoclass_cluster(poisonous, options.k[0], options.eps,
+                                   options.iters, rng)
+        nmeans = autoclass_cluster(nutritious, options.k[1], options.eps,
+                                   options.iters, rng)
+    else:
+        parser.error('Invalid clustering algorithm')
+
+    # Test performance.
+    _, ndist = nearest_means(ntest, nmeans)
+    _, pdist = nearest_means(ntest, pmeans)
+    correct = np.count_nonzero(ndist < pdist)
+
+    _, ndist = nearest_means(ptest, nmeans)
+    _, pdist = nearest_means(ptest, pmeans)
+    correct += np.count_nonzero(pdist < ndist)
+
+    print 'Performance: %f' % (correct / float(len(ntest) + len(ptest)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -3,9 +3,19 @@
 #
 
 import math
+import numpy as np
+import os
+import re
+import struct
+import sys
+import time
 from itertools import *
 
+# The modules that only training, evaluation and the command line need are
+# imported where they are used, to keep the players' startup fast.
+
 NLABELS = 2
+IMGSIZE = 36
 SAMPLES = 20
 LIMIT = 75000
 
@@ -13,12 +23,18 @@ TRAIN_FILE = "../data/plants0.dat"
 VALID_FILE = "../data/plants1.dat"
 TEST_FILE  = "../data/plants2.dat"
 
+CXX_TRAINER = "../nnet/main"
+
 def sigmoid(x):
     denom = 1 + math.exp(-x)
     if denom != 0.0:
         return 1.0 / denom
     return 0.0 if x < 0 else 1.0
 
+def sigmoid_array(x):
+    # Clip so that np.exp() can't overflow; sigmoid is saturated long before.
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -500.0, 500.0)))
+
 class Weight:
     def __init__(self, value):
         self.value = value
@@ -80,10 +96,7 @@ class NeuralNetwork:
 
     @staticmethod
     def Import(path):
-        with open(path, 'r') as f:
-            spec = [int(n) for n in f.readline().split()]
-            weights = [float(w) for w in f.readline().split()]
-
+        spec, weights = read_weights(path)
         return NeuralNetwork(spec).restore(weights)
 
     def feedForward(self, inputv):
@@ -121,11 +134,334 @@ class NeuralNetwork:
         return sum(self.verify(ex) for ex in examples) / float(len(examples))
 
 
-def grouper(iterable, n, fillvalue=None):
-    args = [iter(iterable)] * n
-    return izip_longest(*args, fillvalue=fillvalue)
+#
+# Vectorized backend.  Each layer is kept as a contiguous weight matrix plus a
+# bias vector, and feedForward is a sequence of matrix products.  The flat
+# weight order used by restore() and save() is the same as NeuralNetwork's,
+# i.e., the one written to weights.out by nnet/main.
+#
+# Every method taking an input vector also accepts a matrix with one input per
+# row, in which case it returns one result per row.
+#
+class MatrixNeuralNetwork:
+    def __init__(self, spec):
+        self.spec = list(spec)
+
+        # Biases of the input layer are never used, but they are part of the
+        # weights.out format, so we carry them along.
+        self.input_biases = np.empty(spec[0])
+        self.input_biases.fill(0.5)
+
+        self.matrices = [np.zeros((n, m)) for (m, n) in zip(spec, spec[1:])]
+        self.biases = [np.empty(n) for n in spec[1:]]
+        for bias in self.biases:
+            bias.fill(0.5)
+
+        self.activations = []
+
+    @staticmethod
+    def Import(path):
+        spec, weights = read_weights(path)
+        return MatrixNeuralNetwork(spec).restore(weights)
+
+    def export(self, path):
+        write_weights(path, self.spec, self.save())
+
+    def randomize(self, wmin, wmax):
+        # Like the C++ constructor, only synapse weights are drawn at random;
+        # biases keep their initial value.
+        for w in self.matrices:
+            w[:] = np.random.uniform(wmin, wmax, w.shape)
+        return self
+
+    def feedForward(self, inputv):
+        x = np.asarray(inputv, dtype=np.float64)
+        assert x.shape[-1] == self.spec[0]
+
+        self.activations = [x]
+        for w, b in zip(self.matrices, self.biases):
+            x = sigmoid_array(np.dot(x, w.T) + b)
+            self.activations.append(x)
+
+        return x
+
+    def backPropagate(self, targets, rate):
+        # Gradient step on the squared error of the last feedForward() batch,
+        # averaged over the batch.  With a batch of one, this is exactly
+        # NeuralNetwork::backPropagate in nnet/neural_network.cpp.
+        targets = np.atleast_2d(targets)
+        acts = [np.atleast_2d(a) for a in self.activations]
+        n = float(len(targets))
+
+        out = acts[-1]
+        descent = (targets - out) * out * (1 - out)
+
+        steps = []
+        for i in reversed(xrange(len(self.matrices))):
+            prev = acts[i]
+            steps.append((i, np.dot(descent.T, prev), descent.sum(axis=0)))
+            if i > 0:
+                descent = np.dot(descent, self.matrices[i]) * prev * (1 - prev)
+
+        for (i, dw, db) in steps:
+            self.matrices[i] += (rate / n) * dw
+            self.biases[i] += (rate / n) * db
+
+    def train(self, train_set, valid_set, rate, epochs, batch_size=1,
+              patience=None, shuffle=False, verbose=False):
+        # Mini-batch gradient descent, keeping the weights that did best on
+        # the validation set.  If patience is given, stop once that many
+        # epochs have passed without improving on the best validation score.
+        train_inputs, train_targets = examples_matrix(train_set)
+        valid_inputs, valid_targets = examples_matrix(valid_set)
+
+        assert epochs > 0 and batch_size > 0
+
+        order = np.arange(len(train_inputs))
+        max_epoch, max_perf, weights = 0, 0.0, self.save()
+
+        for i in xrange(epochs):
+            if shuffle:
+                np.random.shuffle(order)
+
+            for k in xrange(0, len(order), batch_size):
+                batch = order[k:k + batch_size]
+                self.feedForward(train_inputs[batch])
+                self.backPropagate(train_targets[batch], rate)
+
+            train_perf = self.accuracy(train_inputs, train_targets)
+            valid_perf = self.accuracy(valid_inputs, valid_targets)
+
+            if verbose:
+                print "%u %2.6f %2.6f" % (i, train_perf, valid_perf)
+
+            # If this is the optimal network so far, save its state.
+            if valid_perf >= max_perf:
+                max_epoch, max_perf, weights = i, valid_perf, self.save()
+            elif patience is not None and i - max_epoch >= patience:
+                break
+
+        # If we passed the optimal network, restore it.
+        if max_epoch != i:
+            self.restore(weights)
+
+        if verbose:
+            print "FINAL EPOCH: %d" % max_epoch
+
+        return max_epoch
+
+    def restore(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        assert len(weights) == self.numWeights()
+
+        k = self.spec[0]
+        self.input_biases[:] = weights[:k]
+
+        for w, b in zip(self.matrices, self.biases):
+            (n, m) = w.shape
+            block = weights[k:k + n * (m + 1)].reshape(n, m + 1)
+            w[:] = block[:, :m]
+            b[:] = block[:, m]
+            k += n * (m + 1)
+
+        return self
+
+    def save(self):
+        weights = [self.input_biases]
+        for w, b in zip(self.matrices, self.biases):
+            weights.append(np.column_stack((w, b)).ravel())
+        return np.concatenate(weights)
+
+    def numWeights(self):
+        return self.spec[0] + sum(w.size + b.size
+                                  for (w, b) in zip(self.matrices, self.biases))
+
+    def confidence(self, inputv, c):
+        return self.feedForward(inputv)[..., c]
+
+    def actuate(self, inputv):
+        outputs = self.feedForward(inputv)
+
+        # Break ties towards the highest index, like max() over the
+        # (activation, index) pairs in NeuralNetwork.actuate().
+        return outputs.shape[-1] - 1 - np.argmax(outputs[..., ::-1], axis=-1)
+
+    def verify(self, example):
+        return 1 if example.target[self.actuate(example.input)] else 0
+
+    def performance(self, examples):
+        return self.accuracy(*examples_matrix(examples))
+
+    def accuracy(self, inputs, targets):
+        hits = targets[np.arange(len(targets)), self.actuate(inputs)]
+        return np.count_nonzero(hits) / float(len(targets))
+
+    def confusion(self, inputs, targets):
+        # counts[i, j] is the number of examples labeled i and classified j.
+        pairs = np.argmax(targets, axis=1) * NLABELS + self.actuate(inputs)
+        return np.bincount(pairs, minlength=NLABELS ** 2).reshape(NLABELS,
+                                                                   NLABELS)
+
+
+def read_weights(path):
+    # Reads either format; binary weights come back as a mapped array.
+    with open(path, 'rb') as f:
+        if f.read(len(WEIGHTS_MAGIC)) == WEIGHTS_MAGIC:
+            return open_weights(path)
+
+    return read_text_weights(path)
+
+def read_text_weights(path):
+    with open(path, 'r') as f:
+        spec = [int(n) for n in f.readline().split()]
+        weights = [float(w) for w in f.readline().split()]
+
+    return spec, weights
+
+def write_weights(path, spec, weights):
+    # Same layout as nnet/main: iostream's default formatting is %g.
+    with open(path, 'w') as f:
+        f.write(''.join('%d ' % n for n in spec) + '\n')
+        f.write(''.join('%g ' % w for w in weights))
+
+#
+# Binary weights.  A 16-byte header (magic, version, number of layers and a
+# CRC-32 of everything after the header), the layer sizes as uint32s padded to
+# 8 bytes, then the flat weights as little-endian doubles in weights.out
+# order, so that they can be memory-mapped as is.  file_get_weights() keeps
+# such a copy next to a text weights file, like file_get_dataset() does for
+# datasets.
+#
+WEIGHTS_MAGIC = 'NNWT'
+WEIGHTS_VERSION = 1
+WEIGHTS_HEADER = struct.Struct('<4sHHI4x')
+
+def weights_cache_path(fname):
+    return fname + '.bin'
+
+def weights_layout(spec):
+    # Byte offset of the weights and their count, given the layer sizes.
+    offset = WEIGHTS_HEADER.size + (4 * len(spec) + 7) // 8 * 8
+    count = spec[0] + sum((m + 1) * n for (m, n) in zip(spec, spec[1:]))
+    return offset, count
+
+def write_binary_weights(path, spec, weights):
+    (offset, count) = weights_layout(spec)
+    weights = np.asarray(weights, dtype='<f8')
+    if len(weights) != count:
+        raise ValueError('%s: expected %d weights for spec %s, got %d'
+                         % (path, count, spec, len(weights)))
+
+    body = np.array(spec, dtype='<u4').tostring()
+    body += '\0' * (offset - WEIGHTS_HEADER.size - len(body))
+    body += weights.tostring()
+    checksum = crc32(body)
+
+    # As with datasets, never let a reader map a half-written file.
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(WEIGHTS_HEADER.pack(WEIGHTS_MAGIC, WEIGHTS_VERSION, len(spec),
+                                    checksum))
+        f.write(body)
+    os.rename(tmp, path)
+
+def crc32(data):
+    import zlib
+    return zlib.crc32(data) & 0xffffffff
+
+def open_weights(path, verify=True):
+    # The checksum covers the whole file, so verifying it reads all of it;
+    # file_get_weights() skips that for the copies it keeps itself.
+    with open(path, 'rb') as f:
+        header = f.read(WEIGHTS_HEADER.size)
+        if len(header) < WEIGHTS_HEADER.size:
+            raise ValueError('%s: truncated weights file' % path)
+        magic, version, nlayers, checksum = WEIGHTS_HEADER.unpack(header)
+        if magic != WEIGHTS_MAGIC or version != WEIGHTS_VERSION:
+            raise ValueError('%s: not a binary weights file' % path)
+        spec = list(np.fromstring(f.read(4 * nlayers), dtype='<u4'))
+
+    spec = [int(n) for n in spec]
+    (offset, count) = weights_layout(spec)
+    if os.path.getsize(path) != offset + 8 * count:
+        raise ValueError('%s: truncated weights file' % path)
+
+    if verify and crc32(np.memmap(path, dtype=np.uint8, mode='r',
+                                  offset=WEIGHTS_HEADER.size)) != checksum:
+        raise ValueError('%s: weights checksum mismatch' % path)
+
+    weights = np.memmap(path, dtype='<f8', mode='r', offset=offset,
+                        shape=(count,))
+    return spec, weights
+
+def convert_weights(fname, path=None):
+    # Text to binary, or binary back to text if fname is already binary.
+    (spec, weights) = read_weights(fname)
+
+    if isinstance(weights, np.memmap):
+        if path is None:
+            path = fname[:-len('.bin')] if fname.endswith('.bin') \
+                   else fname + '.txt'
+        write_weights(path, spec, weights)
+    else:
+        if path is None:
+            path = weights_cache_path(fname)
+        write_binary_weights(path, spec, weights)
+    return path
+
+def file_get_weights(fname):
+    # Return (spec, weights) for a text or binary weights file, going through
+    # the binary copy of text files whenever possible.
+    cache = weights_cache_path(fname)
+
+    try:
+        with open(fname, 'rb') as f:
+            if f.read(len(WEIGHTS_MAGIC)) == WEIGHTS_MAGIC:
+                return open_weights(fname)
+        if (not os.path.exists(cache) or
+                os.path.getmtime(cache) < os.path.getmtime(fname)):
+            write_binary_weights(cache, *read_text_weights(fname))
+        try:
+            return open_weights(cache, verify=False)
+        except ValueError:
+            # A damaged copy, e.g., cut short; rebuild it from the text.
+            write_binary_weights(cache, *read_text_weights(fname))
+            return open_weights(cache, verify=False)
+    except (IOError, OSError):
+        # Can't write the cache; make do with parsing.
+        return read_text_weights(fname)
+
+# Networks loaded by shared_network(), one per weights file and process.
+shared_networks = {}
+
+def shared_network(path):
+    path = os.path.abspath(path)
+    if path not in shared_networks:
+        spec, weights = file_get_weights(path)
+        shared_networks[path] = MatrixNeuralNetwork(spec).restore(weights)
+    return shared_networks[path]
+
+def examples_matrix(examples):
+    # Sets may also be passed around already as (inputs, targets) matrices.
+    if isinstance(examples, tuple):
+        return examples
+
+    inputs = np.array([ex.input for ex in examples], dtype=np.float64)
+    targets = np.array([ex.target for ex in examples], dtype=np.float64)
+    return inputs, targets
 
 def file_get_examples(fname, limit):
+    labels, pixels = file_get_dataset(fname, limit)
+    examples = []
+
+    for label, row in izip(labels.tolist(), pixels.astype(float).tolist()):
+        examples.append(Example(label))
+        examples[-1].input = row
+
+    return examples
+
+def file_parse_examples(fname, limit):
+    # Parse the text format directly, bypassing the binary cache.
     examples = []
 
     with open(fname, 'r') as f:
@@ -139,33 +475,226 @@ def file_get_examples(fname, limit):
 
     return examples
 
-def sample_average(examples, sample_size, take):
-    means = []
 
-    for sample in grouper(examples, sample_size):
-        mu = sample[0]
+#
+# Binary datasets.  A converted plants*.dat is a 16-byte header followed by
+# fixed-size records of one label byte and IMGSIZE pixel bytes, so that it can
+# be memory-mapped as is.  file_get_dataset() keeps such a copy next to each
+# text file and only re-parses the text when it is newer than its copy.
+#
+DATASET_MAGIC = 'PLNT'
+DATASET_VERSION = 1
+DATASET_HEADER = struct.Struct('<4sHH8x')
+DATASET_RECORD = np.dtype([('label', np.uint8),
+                           ('pixels', np.uint8, (IMGSIZE,))])
+
+class PixelValueError(ValueError):
+    # A text dataset the binary format can't hold, though it is well-formed.
+    pass
 
-        for ex in sample[1:take]:
-            for i in xrange(len(mu.input)):
-                mu.input[i] += ex.input[i]
+def dataset_cache_path(fname):
+    return fname + '.bin'
 
-        mu.input = [v / take for v in mu.input]
-        means.append(mu)
+def parse_dataset(fname):
+    labels, pixels = [], []
 
-    return means
+    with open(fname, 'r') as f:
+        for line in f:
+            if line[0] == '#':
+                labels.append(int(line[1:]))
+            else:
+                pixels.append(line)
+
+    values = np.array(' '.join(pixels).split(), dtype=np.float64)
+    if len(values) != len(labels) * IMGSIZE:
+        raise ValueError('%s: expected %d pixels per image' % (fname, IMGSIZE))
+    if np.any((values < 0) | (values > 255) | (values != np.floor(values))):
+        raise PixelValueError('%s: pixels must be integers in [0, 255]'
+                              % fname)
+
+    return (np.array(labels, dtype=np.uint8),
+            values.astype(np.uint8).reshape(-1, IMGSIZE))
+
+def write_dataset(path, labels, pixels):
+    records = np.empty(len(labels), dtype=DATASET_RECORD)
+    records['label'] = labels
+    records['pixels'] = pixels
+
+    # Write to a temporary file first so that readers never map a partially
+    # written dataset.
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(DATASET_HEADER.pack(DATASET_MAGIC, DATASET_VERSION, IMGSIZE))
+        f.write(records.tostring())
+    os.rename(tmp, path)
+
+def write_text_dataset(path, labels, pixels):
+    # The plants*.dat format: a #label line, then one line per image row.
+    with open(path, 'w') as f:
+        width = int(math.sqrt(IMGSIZE))
+        for label, row in izip(labels, pixels.reshape(len(pixels), -1, width)):
+            f.write('#%d\n' % label)
+            f.write(''.join(' '.join(str(px) for px in r) + '\n' for r in row))
+
+def open_dataset(path):
+    # An empty file is an empty dataset, e.g., from a collector that was
+    # stopped before it wrote anything.
+    if os.path.getsize(path) == 0:
+        records = np.empty(0, dtype=DATASET_RECORD)
+        return records['label'], records['pixels']
+
+    with open(path, 'rb') as f:
+        header = f.read(DATASET_HEADER.size)
+    if len(header) < DATASET_HEADER.size:
+        raise ValueError('%s: truncated dataset header' % path)
+    magic, version, npixels = DATASET_HEADER.unpack(header)
+
+    if magic != DATASET_MAGIC or version != DATASET_VERSION:
+        raise ValueError('%s: not a binary plant dataset' % path)
+    if npixels != IMGSIZE:
+        raise ValueError('%s: expected %d pixels per image' % (path, IMGSIZE))
+
+    if os.path.getsize(path) == DATASET_HEADER.size:
+        records = np.empty(0, dtype=DATASET_RECORD)
+    else:
+        records = np.memmap(path, dtype=DATASET_RECORD, mode='r',
+                            offset=DATASET_HEADER.size)
+
+    return records['label'], records['pixels']
+
+def convert_dataset(fname, path=None):
+    if path is None:
+        path = dataset_cache_path(fname)
+    write_dataset(path, *parse_dataset(fname))
+    return path
+
+def file_get_dataset(fname, limit=-1):
+    # Return (labels, pixels) arrays for a text or binary dataset.  For
+    # binary datasets, these are read-only views of the mapped file.
+    if fname.endswith('.bin'):
+        labels, pixels = open_dataset(fname)
+    else:
+        cache = dataset_cache_path(fname)
+
+        try:
+            try:
+                if (not os.path.exists(cache) or
+                        os.path.getmtime(cache) < os.path.getmtime(fname)):
+                    convert_dataset(fname, cache)
+                labels, pixels = open_dataset(cache)
+            except (IOError, OSError):
+                # Can't write the cache; make do with parsing.
+                labels, pixels = parse_dataset(fname)
+        except PixelValueError:
+            # The binary format only holds integer pixels in [0, 255]; parse
+            # anything else as floats, without a cache.
+            examples = file_parse_examples(fname, limit)
+            labels = np.array([ex.target.index(1.0) for ex in examples],
+                              dtype=np.uint8)
+            pixels = np.array([ex.input for ex in examples], dtype=np.float64)
+
+    if limit != -1:
+        labels, pixels = labels[:limit], pixels[:limit]
+    return labels, pixels
 
+#
+# Sample reductions.  The SAMPLES images of a plant are stored one after
+# another, and a reduction turns the first `take` images of every group of
+# sample_size into a single example, labeled like the first, as nnet/main
+# does:
+#
+#   average:   the pixelwise mean of the images
+#   majority:  1 where more than take // 2 of the images are set, 0 elsewhere
+#
+# Reductions take and return (inputs, targets) matrices and never modify their
+# input.  A trailing group with fewer than `take` images is dropped.
+#
+CHUNK_SIZE = 1 << 16
 
-if __name__ == '__main__':
-    network = NeuralNetwork.Import('weights.out')
+def reduce_average(sums, take):
+    return sums / float(take)
 
-    train_set = file_get_examples(TRAIN_FILE, LIMIT)
-    valid_set = file_get_examples(VALID_FILE, LIMIT / 10)
-    test_set  = file_get_examples(TEST_FILE,  LIMIT / 10)
+def reduce_majority(sums, take):
+    return (sums > take // 2).astype(np.float64)
 
-    train_set = sample_average(train_set, SAMPLES, 5)
-    valid_set = sample_average(valid_set, SAMPLES, 5)
-    test_set  = sample_average(test_set,  SAMPLES, 3)
+REDUCTIONS = {'average': reduce_average, 'majority': reduce_majority}
 
+def sample_reduce(inputs, targets, sample_size, take, method='average'):
+    if not 0 < take <= sample_size:
+        raise ValueError('cannot take %d of %d images' % (take, sample_size))
+
+    starts = np.arange(0, len(inputs), sample_size)
+    starts = starts[starts + take <= len(inputs)]
+    rows = starts[:, np.newaxis] + np.arange(take)
+
+    # Images are summed in order, in doubles, like nnet/main does.
+    sums = np.add.reduce(np.asarray(inputs)[rows], axis=1, dtype=np.float64)
+    return (REDUCTIONS[method](sums, take),
+            np.array(targets[starts], dtype=np.float64))
+
+def sample_average(examples, sample_size, take):
+    return sample_reduce(*(examples_matrix(examples) +
+                           (sample_size, take, 'average')))
+
+def sample_majority(examples, sample_size, take):
+    return sample_reduce(*(examples_matrix(examples) +
+                           (sample_size, take, 'majority')))
+
+def stream_samples(chunks, sample_size, take, method='average'):
+    # Reduce a data set that comes in consecutive (inputs, targets) chunks,
+    # which may split groups anywhere, yielding one reduced chunk at a time.
+    rest = None
+
+    for (inputs, targets) in chunks:
+        if rest is not None and len(rest[0]):
+            inputs = np.concatenate((rest[0], inputs))
+            targets = np.concatenate((rest[1], targets))
+
+        whole = len(inputs) // sample_size * sample_size
+        if whole:
+            yield sample_reduce(inputs[:whole], targets[:whole], sample_size,
+                                take, method)
+        rest = (inputs[whole:], targets[whole:])
+
+    if rest is not None and len(rest[0]) >= take:
+        yield sample_reduce(rest[0], rest[1], sample_size, take, method)
+
+def label_targets(labels):
+    return np.eye(NLABELS)[np.asarray(labels, dtype=int)]
+
+def file_dataset_chunks(fname, limit=-1, chunk_size=CHUNK_SIZE):
+    # (pixels, targets) chunks of a dataset.  The pixels are slices of the
+    # mapped binary copy, so only one chunk is in memory at a time.
+    labels, pixels = file_get_dataset(fname, limit)
+    for start in xrange(0, len(labels), chunk_size):
+        yield (pixels[start:start + chunk_size],
+               label_targets(labels[start:start + chunk_size]))
+
+def concat_sets(sets):
+    # Join (inputs, targets) sets into one.
+    sets = list(sets)
+    if not sets:
+        return (np.empty((0, IMGSIZE)), np.empty((0, NLABELS)))
+    return tuple(np.concatenate(parts) for parts in zip(*sets))
+
+def file_get_set(fname, limit, take=None, method='average'):
+    # The (inputs, targets) matrices of a dataset, reduced over SAMPLES images
+    # per plant if take is given.
+    if take is None:
+        return concat_sets((pixels.astype(np.float64), targets) for
+                           (pixels, targets) in file_dataset_chunks(fname, limit))
+    return concat_sets(stream_samples(file_dataset_chunks(fname, limit),
+                                      SAMPLES, take, method))
+
+def load_sets(samples, method='average'):
+    (s0, s1) = samples or (None, None)
+    train_set = file_get_set(TRAIN_FILE, LIMIT,      s0, method)
+    valid_set = file_get_set(VALID_FILE, LIMIT / 10, s0, method)
+    test_set  = file_get_set(TEST_FILE,  LIMIT / 10, s1, method)
+
+    return train_set, valid_set, test_set
+
+def print_performance(network, train_set, valid_set, test_set):
     print (
         "Performance\n"
         "  training:   %lf\n"
@@ -175,3 +704,237 @@ if __name__ == '__main__':
         network.performance(valid_set),
         network.performance(test_set))
     );
+
+def parse_performance(output):
+    return [float(v) for v in
+            re.findall(r'(?:training|validation|test):\s+(\S+)', output)]
+
+def train_network(options, train_set, valid_set):
+    spec = [examples_matrix(train_set)[0].shape[1]] + options.hiddens + [NLABELS]
+    network = MatrixNeuralNetwork(spec).randomize(-0.01, 0.01)
+
+    network.train(train_set, valid_set, options.rate, options.epochs,
+                  batch_size=options.batch_size, patience=options.patience,
+                  shuffle=options.batch_size > 1, verbose=options.verbose)
+    return network
+
+def cxx_args(trainer, epochs, rate, hiddens, samples=None):
+    # Command line for an nnet/main run; the layer count follows from the
+    # hidden layer sizes.
+    args = [trainer, '-e', str(epochs), '-r', str(rate),
+            '-l', str(len(hiddens) + 2)]
+    if hiddens:
+        args += ['-h', ','.join(str(n) for n in hiddens)]
+    if samples:
+        args += ['-s', ','.join(str(n) for n in samples)]
+    return args
+
+def cxx_train(options):
+    # Run nnet/main in a scratch directory next to this one, so that it finds
+    # the same ../data files and its weights.out doesn't clobber ours.
+    import shutil, subprocess, tempfile
+
+    scratch = tempfile.mkdtemp(dir='..')
+    args = cxx_args(os.path.abspath(CXX_TRAINER), options.epochs, options.rate,
+                    options.hiddens, options.samples)
+
+    try:
+        output = subprocess.check_output(args, cwd=scratch)
+    finally:
+        shutil.rmtree(scratch)
+
+    return parse_performance(output)
+
+#
+# Parallel evaluation.  The combined data set is loaded once into the globals
+# below before the worker pool forks, so every worker shares the parent's copy
+# and tasks only carry a fold number and a weights path.
+#
+shared_inputs = None
+shared_targets = None
+shared_folds = None
+
+def share_examples(examples, k, group=SAMPLES):
+    global shared_inputs, shared_targets, shared_folds
+
+    shared_inputs, shared_targets = examples_matrix(examples)
+
+    # Fold by whole plants, since the SAMPLES images of a plant are not
+    # independent of one another: a plant is group consecutive examples, or
+    # just one once its images were reduced to a single example.
+    groups = np.arange(len(shared_inputs)) // group
+    shared_folds = groups * k // (groups[-1] + 1)
+
+def fold_split(fold, k):
+    test = shared_folds == fold
+    valid = shared_folds == (fold + 1) % k
+    train = ~(test | valid)
+    return [(shared_inputs[m], shared_targets[m]) for m in (train, valid, test)]
+
+def evaluate_task((path, fold)):
+    start = time.time()
+    network = MatrixNeuralNetwork.Import(path)
+
+    mask = shared_folds == fold
+    counts = network.confusion(shared_inputs[mask], shared_targets[mask])
+    return (path, fold, counts, time.time() - start)
+
+def crossval_task((options, fold)):
+    start = time.time()
+    np.random.seed(fold)
+
+    train_set, valid_set, test_set = fold_split(fold, options.folds)
+    network = train_network(options, train_set, valid_set)
+    return ('crossval', fold, network.confusion(*test_set), time.time() - start)
+
+def run_pool(task, args, processes):
+    import multiprocessing
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(task, args, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def print_folds(results):
+    for name in sorted(set(r[0] for r in results)):
+        print name
+        total = np.zeros((NLABELS, NLABELS), dtype=int)
+
+        for (_, fold, counts, secs) in sorted(r for r in results
+                                              if r[0] == name):
+            total += counts
+            print "  fold %d: %lf  confusion %s  (%.2fs)" % (
+                fold, np.trace(counts) / float(counts.sum()),
+                ' '.join(str(n) for n in counts.ravel()), secs)
+
+        print "  overall: %lf  confusion %s" % (
+            np.trace(total) / float(total.sum()),
+            ' '.join(str(n) for n in total.ravel()))
+
+def int_list(option, opt, value, parser):
+    setattr(parser.values, option.dest, [int(n) for n in value.split(',')])
+
+def main(argv):
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="Usage: python nnet.py [options] "
+                                "[eval|train|parity|crossval|"
+                                "evaluate WEIGHTS...|convert FILE...|"
+                                "convert-weights WEIGHTS...]",
+                          add_help_option=False)
+    parser.add_option("--help", action="help",
+                      help="show this help message and exit")
+    parser.add_option("-w", dest="weights", default="weights.out",
+                      help="weights file to evaluate or write")
+    parser.add_option("-e", dest="epochs", default=10, type=int,
+                      help="number of training epochs")
+    parser.add_option("-r", dest="rate", default=0.1, type=float,
+                      help="learning rate")
+    parser.add_option("-h", dest="hiddens", default=[], type=str,
+                      action="callback", callback=int_list,
+                      help="comma-separated hidden layer sizes")
+    parser.add_option("-s", dest="samples", default=None, type=str,
+                      action="callback", callback=int_list,
+                      help="average S0,S1 images of each training/test sample")
+    parser.add_option("-m", dest="reduction", default="average",
+                      choices=sorted(REDUCTIONS.keys()),
+                      help="how to combine sampled images: average or majority")
+    parser.add_option("-b", dest="batch_size", default=1, type=int,
+                      help="mini-batch size")
+    parser.add_option("-p", dest="patience", default=None, type=int,
+                      help="stop after this many epochs without improvement")
+    parser.add_option("-t", dest="tolerance", default=0.02, type=float,
+                      help="maximum accuracy difference allowed by parity")
+    parser.add_option("-k", dest="folds", default=5, type=int,
+                      help="number of folds for evaluate and crossval")
+    parser.add_option("-j", dest="processes", default=None, type=int,
+                      help="number of worker processes (default: all cores)")
+    parser.add_option("-v", dest="verbose", action="store_true", default=False,
+                      help="print per-epoch performance")
+    (options, args) = parser.parse_args(argv[1:])
+
+    command = args[0] if args else 'eval'
+
+    if command == 'convert':
+        for fname in args[1:]:
+            print "%s -> %s" % (fname, convert_dataset(fname))
+        return 0
+
+    if command == 'convert-weights':
+        for fname in args[1:]:
+            print "%s -> %s" % (fname, convert_weights(fname))
+        return 0
+
+    if options.samples is not None and len(options.samples) != 2:
+        parser.error("Must specify exactly two sample sizes.")
+
+    # Evaluation has always averaged 5 and 3 images per sample by default.
+    samples = options.samples
+    if command in ('eval', 'evaluate') and samples is None:
+        samples = [5, 3]
+
+    if command == 'evaluate' and options.folds < 1:
+        parser.error("evaluate needs at least one fold.")
+    if command == 'crossval' and options.folds < 3:
+        # Each fold needs distinct training, validation and test folds.
+        parser.error("crossval needs at least three folds.")
+
+    if command in ('evaluate', 'crossval'):
+        # Pool plants0-2.dat, averaging S0 images of every sample.
+        start = time.time()
+        share_examples(concat_sets(load_sets(samples and [samples[0]] * 2,
+                                             options.reduction)),
+                       options.folds, 1 if samples else SAMPLES)
+
+        if command == 'evaluate':
+            tasks = [(path, fold) for path in (args[1:] or [options.weights])
+                                  for fold in xrange(options.folds)]
+            results = run_pool(evaluate_task, tasks, options.processes)
+        else:
+            tasks = [(options, fold) for fold in xrange(options.folds)]
+            results = run_pool(crossval_task, tasks, options.processes)
+
+        print_folds(results)
+        print "Total time: %.2fs" % (time.time() - start)
+        return 0
+
+    train_set, valid_set, test_set = load_sets(samples, options.reduction)
+
+    if command == 'eval':
+        network = MatrixNeuralNetwork.Import(options.weights)
+        print_performance(network, train_set, valid_set, test_set)
+
+    elif command == 'train':
+        start = time.time()
+        network = train_network(options, train_set, valid_set)
+        network.export(options.weights)
+
+        print_performance(network, train_set, valid_set, test_set)
+        print "Trained in %.2fs" % (time.time() - start)
+
+    elif command == 'parity':
+        network = train_network(options, train_set, valid_set)
+        ours = [network.performance(s)
+                for s in (train_set, valid_set, test_set)]
+        theirs = cxx_train(options)
+
+        worst = 0.0
+        for name, a, b in zip(['training', 'validation', 'test'], ours, theirs):
+            print "  %-12s python %lf  c++ %lf" % (name + ':', a, b)
+            worst = max(worst, abs(a - b))
+
+        if worst > options.tolerance:
+            print "Parity FAILED: accuracies differ by %lf" % worst
+            return 1
+        print "Parity OK"
+
+    else:
+        parser.error("Unknown command: %s" % command)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,8 +1,14 @@
+import collections
 import game_interface
+import grid
+import numpy as np
 import random
 import time
+import timeit
 import nnet
 import os
+import pyramid
+import render
 
 
 ########################################
@@ -14,13 +20,63 @@ import os
 WEIGHTS_FILE = 'weights.out'
 absolute_path = os.path.dirname(os.path.abspath(__file__)) + '/' + WEIGHTS_FILE
 
-network = nnet.NeuralNetwork.Import(absolute_path)
+## The network is loaded on first use, from the binary copy of WEIGHTS_FILE
+## (see nnet.file_get_weights), and shared by everything in this process.
+def get_network():
+    return nnet.shared_network(absolute_path)
+
+## Sequential image acquisition: after each image, classify the running mean
+## of the images so far, and stop asking as soon as the network is confident
+## either way.  Every image costs observation_cost life.
+MAX_IMAGES = 3
+NUTRITIOUS_THRESHOLD = 0.9
+POISONOUS_THRESHOLD = 0.1
+
+def confident(confidence):
+    return not POISONOUS_THRESHOLD < confidence < NUTRITIOUS_THRESHOLD
+
+## Classification cache: for the CACHE_SIZE most recently classified
+## positions, the [sum, count] of the images seen there and the network's last
+## confidence, so that a later decision at the same spot builds on that
+## evidence instead of paying for it again.
+CACHE_SIZE = 256
+
+classifications = collections.OrderedDict()
+cache_hits, cache_misses = 0, 0
+
+def lookup_classification(pos):
+    global cache_hits, cache_misses
+
+    entry = classifications.pop(pos, None)
+    if entry == None:
+        cache_misses += 1
+        entry = [np.zeros(nnet.IMGSIZE), 0, 0.5]
+    else:
+        cache_hits += 1
+
+    # (Re)insert as the most recently used, evicting the least.
+    classifications[pos] = entry
+    if len(classifications) > CACHE_SIZE:
+        classifications.popitem(last=False)
+    return entry
+
+def classify_plant(view, pos):
+    entry = lookup_classification(pos)
+    (image_sum, count, confidence) = entry
+    asked = 0
 
-IMAGES_TO_ASK_FOR = 3
+    while count < MAX_IMAGES and not (count and confident(confidence)):
+        # Settle for fewer images rather than overrun the deadline.
+        if count and time_left() < IMAGE_TIME_MARGIN:
+            break
 
-def average_images(l):
-    print l
-    return [sum(image[i] for image in l) / float(len(l)) for i in range(len(l[0]))]
+        image_sum += view.GetImage()
+        count, asked = count + 1, asked + 1
+        confidence = get_network().confidence(image_sum / count, 1)
+
+    entry[1:] = [count, confidence]
+    record_images(asked)
+    return confidence
 
 ########################################
 # Initial Variables
@@ -30,27 +86,16 @@ BOUNDS = 15
 TICKS = range(-BOUNDS, BOUNDS + 1)
 GRID = [(x, y) for x in TICKS for y in reversed(TICKS)]
 
-## Visited array
-
-seen = {}
-for x in range(-BOUNDS, BOUNDS+1):
-    for y in range(-BOUNDS, BOUNDS+1):
-        seen[(x,y)] = '?'
+## Per-game state is allocated once, here, and (re)filled by reset() below,
+## so that one process can play many games.
 
-# seen[(0, 0)] = 'O'
+## Visited array
+seen = grid.Grid(BOUNDS, 'S1')
 
 ## Belief array
-belief = {}
-for x in range(-BOUNDS, BOUNDS+1):
-    for y in range(-BOUNDS, BOUNDS+1):
-        belief[(x,y)] = 'U'
-
-vis = {}
-for x in range(-BOUNDS, BOUNDS+1):
-    for y in range(-BOUNDS, BOUNDS+1):
-        vis[(x,y)] = False
+belief = grid.Grid(BOUNDS, 'S1')
 
-vis[(0, 0)] = False
+vis = grid.Grid(BOUNDS, bool)
 
 ## Density
 
@@ -63,16 +108,42 @@ PLANT_PRIOR_DENSITY = 330.0 / 1680
 BIN_RADIUS = 4
 BIN_AREA = float((BIN_RADIUS + 1) ** 2)
 
-density = {}
+density = grid.Grid(BOUNDS, np.float64)
+
+# density.cells[cell(pos)] is the density at pos.
+cell = density.index
+
+DENSITY_START = np.empty((2*BOUNDS + 1, 2*BOUNDS + 1))
 for pos in GRID:
     if dist(pos, (0,0)) < BOUNDS * 1.75: 
-        density[pos] = PLANT_PRIOR_DENSITY
+        DENSITY_START[cell(pos)] = PLANT_PRIOR_DENSITY
     else:
-        density[pos] = -PLANT_PRIOR_DENSITY
+        DENSITY_START[cell(pos)] = -PLANT_PRIOR_DENSITY
 
-other = {}
-for pos in GRID:
-    other[pos] = False
+density.cells[:] = DENSITY_START
+
+# Max index over the density map; all writes to density go through
+# set_density() or add_falloff() to keep it current.
+density_index = pyramid.MaxPyramid(density.cells)
+
+def set_density(pos, value):
+    density_index.set(pos[0] + BOUNDS, pos[1] + BOUNDS, value)
+    if on_route[pos]:
+        drop_route()
+
+other = grid.Grid(BOUNDS, bool)
+
+## Planned route (see plan_route): the cells still to walk, target last, where
+## we should be when we take the next step, and how far the density along the
+## route has drifted since it was planned.  on_route marks its cells.
+route, route_pos, route_drift = None, None, 0.0
+on_route = grid.Grid(BOUNDS, bool)
+
+def drop_route():
+    global route, route_pos
+    if route is not None:
+        route, route_pos = None, None
+        on_route.fill(False)
 
 target = (-BOUNDS, -BOUNDS)
 
@@ -90,9 +161,68 @@ prev_pos = None
 ## Plant consumption stats
 eaten_nut, eaten_pois = 0, 0
 
+## Image stats
+images_asked, plants_classified = 0, 0
+
+def record_images(n):
+    global images_asked, plants_classified
+    images_asked += n
+    plants_classified += 1
+
+## Anytime protocol (see rg.py): best_move is our best (move, eat) so far this
+## turn, and deadline is when rg.py needs it by.
+best_move = None
+deadline = None
+
+# Don't ask for another image with less time than this left.
+IMAGE_TIME_MARGIN = 0.02
+
+# Nor plan a route.
+ROUTE_TIME_MARGIN = 0.01
+
+def time_left():
+    if deadline == None:
+        return float('inf')
+    return deadline - timeit.default_timer()
+
+## Start a new game.  rg.py calls this between the games a process plays.
+## The network, the neighborhood tables and the falloff kernels carry over.
+def reset():
+    global target, prev_life, prev_pos, eaten_nut, eaten_pois
+    global images_asked, plants_classified, cache_hits, cache_misses
+    global best_move, deadline, densest_cache, screen
+    global route, route_pos
+
+    seen.fill('?')
+    belief.fill('U')
+    vis.fill(False)
+    other.fill(False)
+
+    density.cells[:] = DENSITY_START
+    density_index.refresh(0, density.size, 0, density.size)
+    densest_cache = (None, None, [])
+    route, route_pos = None, None
+    on_route.fill(False)
+    classifications.clear()
+
+    target = (-BOUNDS, -BOUNDS)
+    prev_life, prev_pos = None, None
+    eaten_nut, eaten_pois = 0, 0
+    images_asked, plants_classified = 0, 0
+    cache_hits, cache_misses = 0, 0
+    best_move, deadline = None, None
+    screen = None
+
+reset()
+
 ## Printing constants
 NO_PLANT_CHAR = '.'
 
+## With LIVE_BOARD, get_move redraws the board every turn, at most FRAME_RATE
+## times a second.
+LIVE_BOARD = False
+FRAME_RATE = 10
+
 MOVE_THRESHOLD = PLANT_PRIOR_DENSITY + 0.01
 
 ########################################
@@ -108,15 +238,59 @@ def next_move((x, y), (tx, ty)):
         return game_interface.DOWN if ty < y else game_interface.UP
     return random.randint(0, 3)
 
-def neighbors((x, y), r):
-    return [(nx, ny) for (nx, ny) in GRID if abs(x - nx) + abs(y - ny) <= r]
+## Neighborhood tables
+
+# Offsets of the Manhattan ball of radius r, in GRID order.
+ball_offsets_cache = {}
+
+def ball_offsets(r):
+    if r not in ball_offsets_cache:
+        ticks = range(-r, r + 1)
+        offsets = [(dx, dy) for dx in ticks for dy in reversed(ticks)
+                   if abs(dx) + abs(dy) <= r]
+        ball_offsets_cache[r] = np.array(offsets, dtype=int).reshape(-1, 2)
+    return ball_offsets_cache[r]
+
+# Cells of the ball of radius r around pos that lie on the board, as an array
+# of (x, y) rows in GRID order.
+def neighbor_array(pos, r):
+    cells = ball_offsets(r) + pos
+    return cells[np.all(np.abs(cells) <= BOUNDS, axis=1)]
+
+def neighbors(pos, r):
+    return [tuple(n_pos) for n_pos in neighbor_array(pos, r).tolist()]
+
+# Density falloff around a cell: weight * (r - d + 1) / (r + 1) at distance
+# d <= r, scaled like the per-cell updates this replaces so that the results
+# are bit-for-bit the same.
+falloff_cache = {}
+
+def falloff_kernel(weight, r):
+    if (weight, r) not in falloff_cache:
+        ticks = np.arange(-r, r + 1)
+        d = np.abs(ticks[:, np.newaxis]) + np.abs(ticks[np.newaxis, :])
+        kernel = weight * PLANT_PRIOR_DENSITY / BIN_AREA * (r - d + 1) / (r + 1)
+        falloff_cache[(weight, r)] = np.where(d <= r, kernel, 0.0)
+    return falloff_cache[(weight, r)]
+
+def add_falloff(pos, weight, r=BIN_RADIUS):
+    (x, y) = cell(pos)
+    size = 2*BOUNDS + 1
+    (x0, x1) = (max(x - r, 0), min(x + r + 1, size))
+    (y0, y1) = (max(y - r, 0), min(y + r + 1, size))
+
+    kernel = falloff_kernel(weight, r)[x0 - x + r:x1 - x + r, y0 - y + r:y1 - y + r]
+    density.cells[x0:x1, y0:y1] += kernel
+    density_index.refresh(x0, x1, y0, y1)
+    if route is not None:
+        note_drift(np.sum(kernel[on_route.cells[x0:x1, y0:y1]]))
 
 
 # update the "nutritious" density
 def update_density(pos, plant, ate_plant=True):
     global density
-    print pos, plant
-    if pos not in GRID:
+    # print pos, plant
+    if pos not in vis:
         return
 
     if vis[pos]:
@@ -124,54 +298,145 @@ def update_density(pos, plant, ate_plant=True):
     if plant != 'U':
         vis[pos] = True
     if plant == NO_PLANT_CHAR:
-        for n_pos in neighbors(pos, BIN_RADIUS):
-            density[n_pos] -= 1 * PLANT_PRIOR_DENSITY / BIN_AREA * (BIN_RADIUS - dist(pos, n_pos) + 1) / (BIN_RADIUS + 1)
-        density[pos] = -9999
+        add_falloff(pos, -1)
+        set_density(pos, -9999)
     elif plant == 'U':
-        for n_pos in neighbors(pos, BIN_RADIUS):
-            density[n_pos] -= 2 * PLANT_PRIOR_DENSITY / BIN_AREA * (BIN_RADIUS - dist(pos, n_pos) + 1) / (BIN_RADIUS + 1)
-        density[pos] = -9999
+        add_falloff(pos, -2)
+        set_density(pos, -9999)
         assert not ate_plant
     elif plant == 'P':
-        density[pos] = -9999
-        for n_pos in neighbors(pos, BIN_RADIUS):
-            density[n_pos] -= 4 * PLANT_PRIOR_DENSITY / BIN_AREA * (BIN_RADIUS - dist(pos, n_pos) + 1) / (BIN_RADIUS + 1)
+        set_density(pos, -9999)
+        add_falloff(pos, -4)
     elif plant == 'N':
-        density[pos] = -9999 
-        for n_pos in neighbors(pos, BIN_RADIUS):
-            if other[pos]:
-                # other player already ate this nutritious plant - he probably ate others in the area as well
-                nut_weight = -2
-            else:
-                nut_weight = 8
-            density[n_pos] += nut_weight * PLANT_PRIOR_DENSITY / BIN_AREA * (BIN_RADIUS - dist(pos, n_pos) + 1) / (BIN_RADIUS + 1)
-        density[pos] = -9999
+        set_density(pos, -9999) 
+        if other[pos]:
+            # other player already ate this nutritious plant - he probably ate others in the area as well
+            nut_weight = -2
+        else:
+            nut_weight = 8
+        add_falloff(pos, nut_weight)
+        set_density(pos, -9999)
 
 SEARCH_RADIUS = 3
 
-def densest_pos(cur_pos=None):
-    max_density = PLANT_PRIOR_DENSITY
-    best_pos = []
+# The densest cells near cur_pos, up to four of them, nearest first.  Cached
+# until the density map or the position changes.
+densest_cache = (None, None, [])
+
+def densest_cells(cur_pos):
+    global densest_cache
+    if densest_cache[:2] == (cur_pos, density_index.version):
+        return densest_cache[2]
+
+    # Search within SEARCH_RADIUS, or out to the nearest cell at least as
+    # dense as the prior if there is none that close.
+    (x, y) = cell(cur_pos)
+    nearest = density_index.nearest((x, y), PLANT_PRIOR_DENSITY)
+    if nearest is None:
+        best_pos = []
+    else:
+        radius = max(SEARCH_RADIUS, nearest)
+        (_, cells) = density_index.best_within((x, y), radius, PLANT_PRIOR_DENSITY)
+        best_pos = [(bx - BOUNDS, by - BOUNDS) for (bx, by) in cells]
+
+    # Ties go to GRID order, i.e., by x and then by decreasing y.
+    best_pos.sort(key=lambda (bx, by): (dist(cur_pos, (bx, by)), bx, -by))
+    densest_cache = (cur_pos, density_index.version, best_pos[0:4])
+    return densest_cache[2]
 
-    radius_buff = 0
+def densest_pos(cur_pos=None):
     if cur_pos != None:
-        while len(best_pos) == 0:
-            for pos in neighbors(cur_pos, SEARCH_RADIUS + radius_buff):
-                if density[pos] > max_density:
-                    best_pos = [pos]
-                    max_density = density[pos]
-                elif density[pos] == max_density:
-                    best_pos.append(pos)
-
-            
-            radius_buff += 1
-            
-                # best_pos = filter(lambda bp: density[bp] > MOVE_THRESHOLD, neighbors(cur_pos, 5))
-                # print best_pos, cur_pos
-        move = random.choice(sorted(best_pos, key=lambda bp: dist(cur_pos, bp))[0:4])
-        return move 
+        best_pos = densest_cells(cur_pos)
+        if best_pos:
+            return random.choice(best_pos)
     return random.choice(GRID)
 
+## Route planning.  A route is a shortest path to the target, so it costs no
+## more life than walking straight there, chosen to pass through the most
+## expected plant density on the way.  It is kept, target included, until it
+## is walked, until we stray from it, or until update_density changes the
+## cells along it: sets one of them, or shifts the density summed over them by
+## more than ROUTE_SLACK.
+##
+## With PLAN_ROUTES off, get_move steps straight towards a freshly chosen
+## target every turn instead.  Routes have yet to win more games that way:
+## 132 against 134 of 600 simulated games against player.
+PLAN_ROUTES = False
+ROUTE_SLACK = PLANT_PRIOR_DENSITY / 2
+
+def on_board((x, y)):
+    return abs(x) <= BOUNDS and abs(y) <= BOUNDS
+
+def note_drift(change):
+    global route_drift
+    route_drift += change
+    if abs(route_drift) > ROUTE_SLACK:
+        drop_route()
+
+def plan_route((x, y), (tx, ty)):
+    global route, route_pos, route_drift
+    drop_route()
+
+    # value[a, b] is the density at (x + a*sx, y + b*sy); best[a, b] the most
+    # that can be collected on the way from there to the target.  Cells we
+    # have seen keep their large negative density, so a route only crosses
+    # them when every shortest path does.
+    sx = 1 if tx >= x else -1
+    sy = 1 if ty >= y else -1
+    (i, j) = cell((x, y))
+    value = density.cells[i::sx, j::sy][:abs(tx - x) + 1, :abs(ty - y) + 1]
+    (w, h) = value.shape
+    best = np.zeros((w, h))
+    for a in reversed(xrange(w)):
+        for b in reversed(xrange(h)):
+            if a + 1 < w and b + 1 < h:
+                best[a, b] = max(value[a + 1, b] + best[a + 1, b],
+                                 value[a, b + 1] + best[a, b + 1])
+            elif a + 1 < w:
+                best[a, b] = value[a + 1, b] + best[a + 1, b]
+            elif b + 1 < h:
+                best[a, b] = value[a, b + 1] + best[a, b + 1]
+
+    # Walk it; ties step along x first, like next_move.
+    route = []
+    (a, b) = (0, 0)
+    while (a, b) != (w - 1, h - 1):
+        if b + 1 == h or (a + 1 < w and value[a + 1, b] + best[a + 1, b] >=
+                                        value[a, b + 1] + best[a, b + 1]):
+            a += 1
+        else:
+            b += 1
+        route.append((x + a*sx, y + b*sy))
+        on_route[route[-1]] = True
+    route_pos, route_drift = (x, y), 0.0
+
+## The next step towards the densest spot, along the planned route; a new
+## target and route are only chosen once the old route is done with.  A new
+## target is refined in steps under the deadline: first a straight step towards
+## it is published, then replaced by the planned route's, if there is time.
+def route_move(pos):
+    global target, route_pos
+
+    if route_pos != pos or not route:
+        target = densest_pos(pos)
+        if on_board(pos) and pos != target:
+            publish(next_move(pos, target), False)
+            if time_left() > ROUTE_TIME_MARGIN:
+                plan_route(pos, target)
+            else:
+                drop_route()
+                return best_move[0]
+    if not route:
+        # We're on the target already, or off the board, where there is
+        # nothing to plan over.
+        drop_route()
+        return next_move(pos, target)
+
+    step = route.pop(0)
+    on_route[step] = False
+    route_pos = step
+    return next_move(pos, step)
+
 def next_target((X, Y)):
     if Y == BOUNDS:
         return (X + 1, -BOUNDS)
@@ -191,24 +456,23 @@ def get_move(view):
     if view.GetLife() >= prev_life + 15:
         eaten_nut += 1
         # print "Nutritious", prev_life, view.GetLife()
-        seen[prev_pos] = 'N'
+        if prev_pos in seen:
+            seen[prev_pos] = 'N'
         ate_plant = True
     if view.GetLife() <= prev_life - 8:
         eaten_pois += 1
         # print "Poisonous", prev_life, view.GetLife()
-        seen[prev_pos] = 'P'
+        if prev_pos in seen:
+            seen[prev_pos] = 'P'
         ate_plant = True
 
     # update the density
-    print 'Prev_pos:', prev_pos
-    if prev_pos in GRID:
+    # print "Prev_pos:", prev_pos
+    if prev_pos in seen:
         update_density(prev_pos, seen[prev_pos], ate_plant)
 
     (X, Y) = (view.GetXPos(), view.GetYPos())
 
-    # target the densest spot
-    target = densest_pos((view.GetXPos(), view.GetYPos()))
-
     # Eat any plant we find.
     has_plant = view.GetPlantInfo() == game_interface.STATUS_UNKNOWN_PLANT
 
@@ -221,7 +485,7 @@ def get_move(view):
     prev_life = view.GetLife()
 
     # update where we have been
-    if abs(X) <= BOUNDS and abs(Y) <= BOUNDS:
+    if (X,Y) in seen:
         # print 'plant info', view.GetPlantInfo()
         # seen[(X,Y)] = pl_chr(view.GetPlantInfo())
         if view.GetPlantInfo() == game_interface.STATUS_NO_PLANT:
@@ -238,16 +502,18 @@ def get_move(view):
 
     # time.sleep(0.1)
 
-    # print_board((X,Y))
-
+    # head for the densest spot; until we have classified the plant here,
+    # only eat it if we already know it to be nutritious.
+    if PLAN_ROUTES:
+        move = route_move((X, Y))
+    else:
+        target = densest_pos((X, Y))
+        move = next_move((X, Y), target)
+    publish(move, has_plant and (X,Y) in belief and belief[(X, Y)] == 'N')
 
     # Figure out whether to eat the plant or not...
-    if (X,Y) in GRID and has_plant and belief[(X,Y)] != 'P':
-        images = []
-        for i in range(IMAGES_TO_ASK_FOR):
-            images.append(view.GetImage())
-
-        confidence = network.confidence(average_images(images), 1)
+    if (X,Y) in belief and has_plant and belief[(X,Y)] != 'P':
+        confidence = classify_plant(view, (X,Y))
         confidence = 1.0 if confidence >= 0.5 else confidence / 2
 
         belief[(X,Y)] = 'N' if random.random() < confidence else 'P'
@@ -258,9 +524,9 @@ def get_move(view):
         #     belief[(X, Y)] = 'N'
         if belief[(X,Y)] == 'P':
             # don't go back to an image we think is poisonous
-            density[(X,Y)] = -9999
+            set_density((X,Y), -9999)
 
-    hungry = has_plant and (X,Y) in GRID and belief[(X, Y)] != 'P'
+    hungry = has_plant and (X,Y) in belief and belief[(X, Y)] != 'P'
 
     # get hungry randomly
     # if has_plant and (X,Y) in GRID and belief[(X, Y)] != 'P':
@@ -268,9 +534,15 @@ def get_move(view):
     #         if random.random() < (50 - view.GetLife()) / 100.0:
     #             hungry = True
 
-    
+    if LIVE_BOARD:
+        print_board((X, Y), live=True)
+
+    return publish(move, hungry)
 
-    return (next_move((X, Y), target), hungry)
+def publish(move, eat):
+    global best_move
+    best_move = (move, eat)
+    return best_move
 
 
 
@@ -319,31 +591,62 @@ def colorize(s, pos=None):
         c = 200
     return '\033[38;5;%dm%s\033[m' % (c,s)
 
-def print_board(pos=None):
-    print chr(27) + "[2J"
-    nut, pois = 0, 0
-    area = 1.0 * (2*BOUNDS + 1) ** 2
-
-    for x in range(-BOUNDS, BOUNDS+1):
-        for y in range(-BOUNDS, BOUNDS+1):
-            nut += 1 if seen[(x,y)] == 'N' else 0
-            pois += 1 if seen[(x,y)] == 'P' else 0
-
-    dense_pos = densest_pos(pos)
-    tmpdns, seen[dense_pos] =  seen[dense_pos], 'D'
-
-    if pos != None and pos in GRID:
-        tmp = seen[pos]
-        seen[pos] = 'M'
-
-    for y in reversed(range(-BOUNDS, BOUNDS+1)):
-            print '' +''.join([colorize(seen[(x,y)], (x,y)) for x in range(-BOUNDS, BOUNDS+1)]), 
-            print ' '.join(['%0.2f' % (density[(x,y)] if density[(x,y)] > -2 else -5) for x in range(-BOUNDS, BOUNDS+1)])
+## Board panels: the cells, and the density of each beside them.  Each cell's
+## key packs its code, whether the other player found it, and its density
+## class, i.e., everything colorize looks at.
+def board_keys():
+    dclass = np.where(density.cells > PLANT_PRIOR_DENSITY, 2,
+                      np.where(density.cells < 0, 0, 1))
+    return (seen.cells.view(np.uint8).astype(int) * 8 +
+            other.cells * 4 + dclass)
+
+def board_glyph(key, pos):
+    # Negative keys are marks.
+    if key < 0:
+        return colorize(chr(-key))
+    return colorize(chr(key >> 3), pos)
+
+def density_keys():
+    d = density.cells
+    return np.round(np.where(d > -2, d, -5) * 100).astype(int)
+
+def density_glyph(key, pos):
+    return ' %5.2f' % (key / 100.0)
+
+def new_screen():
+    return (render.BoardRenderer(BOUNDS, board_glyph),
+            render.BoardRenderer(BOUNDS, density_glyph, left=2*BOUNDS + 2,
+                                 width=6),
+            render.Throttle(FRAME_RATE))
+
+## Redraw what changed since the last frame.  Live frames are dropped while
+## FRAME_RATE is exceeded; other calls, like rg.py's at the end of a game,
+## always draw.
+def print_board(pos=None, live=False):
+    global screen
+
+    fresh = screen is None
+    if fresh:
+        screen = new_screen()
+    (cells, densities, frames) = screen
+    if not frames.ready(force=not live):
+        return
 
-    if pos != None and pos in GRID:
-        seen[pos] = tmp
+    marks = {target: -ord('D')}
+    if pos in seen:
+        marks[pos] = -ord('M')
 
-    seen[dense_pos] = tmpdns
+    out = [render.CLEAR] if fresh else []
+    out.append(cells.render(board_keys(), marks, codes=seen.cells))
+    out.append(densities.render(density_keys()))
 
-    print eaten_nut, eaten_pois, area
-    
\ No newline at end of file
+    area = 1.0 * (2*BOUNDS + 1) ** 2
+    out.append(render.status(2*BOUNDS + 2, [
+        '%d %d %s' % (eaten_nut, eaten_pois, area),
+        'seen: %d nutritious, %d poisonous' % (cells.count('N'),
+                                               cells.count('P')),
+        '%d images for %d plants' % (images_asked, plants_classified),
+        'classification cache: %d hits %d misses' % (cache_hits,
+                                                     cache_misses),
+        '']))
+    render.emit(''.join(out))
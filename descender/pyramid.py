@@ -0,0 +1,113 @@
+#
+# pyramid.py - Max-pyramid index over a 2D array.
+#
+# Level 0 is the array itself, padded with -inf to a power-of-two square, and
+# each level above holds the maxima of 2x2 blocks of the one below.  After a
+# write to the array, refresh() repairs only the pyramid entries above the
+# written region, so a point update costs O(log n).  Queries walk the pyramid
+# top-down and prune every block whose maximum can't beat the best so far or
+# that lies outside the query's Manhattan ball.
+#
+
+import heapq
+import numpy as np
+
+class MaxPyramid:
+    def __init__(self, values):
+        self.values = values
+        self.version = 0
+
+        (w, h) = values.shape
+        size = 1
+        while size < max(w, h):
+            size *= 2
+
+        self.levels = []
+        while True:
+            level = np.empty((size, size))
+            level.fill(-np.inf)
+            self.levels.append(level)
+            if size == 1:
+                break
+            size //= 2
+
+        self.refresh(0, w, 0, h)
+
+    def refresh(self, x0, x1, y0, y1):
+        # Repair the pyramid after values[x0:x1, y0:y1] changed.
+        self.version += 1
+        self.levels[0][x0:x1, y0:y1] = self.values[x0:x1, y0:y1]
+
+        for k in xrange(1, len(self.levels)):
+            (x0, x1) = (x0 // 2, (x1 + 1) // 2)
+            (y0, y1) = (y0 // 2, (y1 + 1) // 2)
+
+            below = self.levels[k-1][2*x0:2*x1, 2*y0:2*y1]
+            self.levels[k][x0:x1, y0:y1] = np.maximum(
+                np.maximum(below[0::2, 0::2], below[1::2, 0::2]),
+                np.maximum(below[0::2, 1::2], below[1::2, 1::2]))
+
+    def set(self, x, y, value):
+        self.values[x, y] = value
+        self.refresh(x, x + 1, y, y + 1)
+
+    def nearest(self, (cx, cy), threshold):
+        # Manhattan distance from (cx, cy) to the nearest cell whose value is
+        # at least threshold, or None if there is no such cell.
+        top = len(self.levels) - 1
+        queue = [(0, top, 0, 0)]
+
+        while queue:
+            (d, k, i, j) = heapq.heappop(queue)
+            if k == 0:
+                return d
+
+            for (ci, cj) in children(i, j):
+                if self.levels[k-1][ci, cj] >= threshold:
+                    heapq.heappush(queue, (block_distance(cx, cy, k-1, ci, cj),
+                                           k-1, ci, cj))
+        return None
+
+    def best_within(self, (cx, cy), r, threshold):
+        # Find the largest value v >= threshold among the cells within
+        # Manhattan distance r of (cx, cy), and return (v, cells), where
+        # cells lists every cell holding v.  Returns (None, []) if no cell
+        # qualifies.
+        best, cells = threshold, []
+        stack = [(len(self.levels) - 1, 0, 0)]
+
+        while stack:
+            (k, i, j) = stack.pop()
+            if self.levels[k][i, j] < best:
+                continue
+
+            if k == 0:
+                v = self.levels[0][i, j]
+                if v > best or not cells:
+                    best, cells = v, []
+                cells.append((i, j))
+                continue
+
+            # Push the smaller maxima first, so that the larger ones are
+            # explored first and raise the bar quickly.
+            kids = [(self.levels[k-1][ci, cj], ci, cj) for (ci, cj)
+                    in children(i, j)
+                    if block_distance(cx, cy, k-1, ci, cj) <= r]
+            for (v, ci, cj) in sorted(kids):
+                stack.append((k-1, ci, cj))
+
+        if not cells:
+            return (None, [])
+        return (best, cells)
+
+def children(i, j):
+    return ((2*i, 2*j), (2*i + 1, 2*j), (2*i, 2*j + 1), (2*i + 1, 2*j + 1))
+
+def block_distance(cx, cy, k, i, j):
+    # Manhattan distance from (cx, cy) to the nearest cell of block (i, j) at
+    # level k.
+    size = 1 << k
+    (x0, y0) = (i * size, j * size)
+    dx = max(x0 - cx, 0, cx - (x0 + size - 1))
+    dy = max(y0 - cy, 0, cy - (y0 + size - 1))
+    return dx + dy
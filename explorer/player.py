@@ -1,18 +1,32 @@
 import game_interface
+import grid
+import numpy as np
 import random
+import render
 import time
 
 
 BOUNDS = 12
-seen = {}
-for x in range(-BOUNDS, BOUNDS+1):
-    for y in range(-BOUNDS, BOUNDS+1):
-        seen[(x,y)] = '?'
-
-seen[(0, 0)] = 'O'
+seen = grid.Grid(BOUNDS, 'S1')
 
 target = (-BOUNDS, -BOUNDS)
 
+# With LIVE_BOARD, get_move redraws the board every turn, at most FRAME_RATE
+# times a second.
+LIVE_BOARD = False
+FRAME_RATE = 10
+
+# Start a new game; rg.py calls this between the games a process plays.
+def reset():
+    global target, prev_life, screen
+    seen.fill('?')
+    seen[(0, 0)] = 'O'
+    target = (-BOUNDS, -BOUNDS)
+    prev_life = 10000
+    screen = None
+
+reset()
+
 def next_target((X, Y)):
     if Y == BOUNDS:
         return (X + 1, -BOUNDS)
@@ -55,12 +69,15 @@ def get_move(view):
 
     (X, Y) = (view.GetXPos(), view.GetYPos())
 
-    if abs(X) <= BOUNDS and abs(Y) <= BOUNDS and (X,Y) != (0,0):
+    if (X,Y) in seen and (X,Y) != (0,0):
         seen[(X,Y)] = pl_chr(view.GetPlantInfo())
 
     if target == (X, Y):
         target = next_target(target)
 
+    if LIVE_BOARD:
+        print_board((X, Y), live=True)
+
     #print target
     # walk towards the target.
     return (next_move((X, Y), target), hasPlant)
@@ -77,16 +94,28 @@ def colorize(s):
         return s
     return s
 
-def print_board(pos=None):
-    nut, pois = 0, 0
-    area = 1.0 * (2*BOUNDS + 1) ** 2
+# Rows go from y = -BOUNDS at the top down to y = BOUNDS.
+def new_screen():
+    return (render.BoardRenderer(BOUNDS, lambda key, pos: colorize(chr(key)),
+                                 y_up=False),
+            render.Throttle(FRAME_RATE))
 
-    for x in range(-BOUNDS, BOUNDS+1):
-        for y in range(-BOUNDS, BOUNDS+1):
-            nut += 1 if seen[(x,y)] == 'N' else 0
-            pois += 1 if seen[(x,y)] == 'P' else 0
+# Redraw what changed since the last frame.  Live frames are dropped while
+# FRAME_RATE is exceeded; other calls always draw.
+def print_board(pos=None, live=False):
+    global screen
 
-    for y in range(-BOUNDS, BOUNDS+1):
-            print '' +''.join([colorize(seen[(x,y)]) for x in range(-BOUNDS, BOUNDS+1)])
+    fresh = screen is None
+    if fresh:
+        screen = new_screen()
+    (cells, frames) = screen
+    if not frames.ready(force=not live):
+        return
 
-    print nut, pois, area
\ No newline at end of file
+    out = [render.CLEAR] if fresh else []
+    out.append(cells.render(seen.cells.view(np.uint8), codes=seen.cells))
+
+    area = 1.0 * (2*BOUNDS + 1) ** 2
+    out.append(render.status(2*BOUNDS + 2, [
+        '%d %d %s' % (cells.count('N'), cells.count('P'), area), '']))
+    render.emit(''.join(out))
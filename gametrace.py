@@ -0,0 +1,184 @@
+#
+# gametrace.py - Compact binary game traces.
+#
+# A trace holds everything the players saw and did in one game.  A
+# 32-byte header is followed by the game parameters (plant_bonus,
+# plant_penalty, observation_cost, starting_life, life_per_turn and the
+# seed) and by the two player names.  Then, for every round and for each
+# player in turn, there is a move record:
+#
+#   x, y, life      int32   position and life at the start of the move
+#   plant           uint8   GetPlantInfo()
+#   move, eat       uint8   the move that was played
+#   nimages         uint16  number of GetImage() calls, followed by that
+#                           many images of IMAGE_SIZE uint8 pixels each
+#
+# rg.py --trace writes traces through RecordingView and TraceWriter, and
+# replay.py feeds them back to players through ReplayView.
+#
+
+import struct
+import numpy as np
+
+TRACE_MAGIC = 'RGTR'
+TRACE_VERSION = 1
+TRACE_HEADER = struct.Struct('<4sHH5iq')
+TRACE_NAME = struct.Struct('<H')
+TRACE_MOVE = struct.Struct('<iiiBBBH')
+
+IMAGE_SIZE = 36
+
+class Move:
+    def __init__(self, x, y, life, plant, move, eat, images):
+        self.x, self.y, self.life, self.plant = x, y, life, plant
+        self.move, self.eat = move, eat
+        self.images = images
+
+class RecordingView:
+    # Wraps a player's view and remembers what the player saw during its
+    # current move; begin() starts a new move.
+    def __init__(self, view):
+        self.view = view
+        self.begin()
+
+    def begin(self):
+        self.x, self.y = self.view.GetXPos(), self.view.GetYPos()
+        self.life = self.view.GetLife()
+        self.plant = self.view.GetPlantInfo()
+        self.images = []
+
+    def GetXPos(self):
+        return self.view.GetXPos()
+
+    def GetYPos(self):
+        return self.view.GetYPos()
+
+    def GetLife(self):
+        return self.view.GetLife()
+
+    def GetRound(self):
+        return self.view.GetRound()
+
+    def GetPlantInfo(self):
+        return self.view.GetPlantInfo()
+
+    def GetImage(self):
+        image = self.view.GetImage()
+        self.images.append(image)
+        return image
+
+class TraceWriter:
+    def __init__(self, path, options, names, seed=None):
+        self.f = open(path, 'wb')
+        self.f.write(TRACE_HEADER.pack(
+            TRACE_MAGIC, TRACE_VERSION, len(names),
+            options.plant_bonus, options.plant_penalty,
+            options.observation_cost, options.starting_life,
+            options.life_per_turn, -1 if seed is None else seed))
+        for name in names:
+            self.f.write(TRACE_NAME.pack(len(name)) + name)
+
+    def write(self, view, move, eat):
+        # Record the move the player behind the RecordingView view just made.
+        self.f.write(TRACE_MOVE.pack(view.x, view.y, view.life, view.plant,
+                                     move, bool(eat), len(view.images)))
+        if view.images:
+            self.f.write(np.asarray(view.images, dtype=np.uint8).tostring())
+
+    def close(self):
+        self.f.close()
+
+class Trace:
+    def __init__(self, params, seed, names, rounds):
+        self.params = params
+        self.seed = seed
+        self.names = names
+        # rounds[r][p] is the Move of player p + 1 in round r.
+        self.rounds = rounds
+
+    @property
+    def observation_cost(self):
+        return self.params['observation_cost']
+
+def read_trace(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    fields = TRACE_HEADER.unpack_from(data)
+    (magic, version, nplayers) = fields[:3]
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError('%s: not a game trace' % path)
+    params = dict(zip(['plant_bonus', 'plant_penalty', 'observation_cost',
+                       'starting_life', 'life_per_turn'], fields[3:8]))
+    seed = None if fields[8] == -1 else fields[8]
+
+    offset = TRACE_HEADER.size
+    names = []
+    for _ in xrange(nplayers):
+        (n,) = TRACE_NAME.unpack_from(data, offset)
+        offset += TRACE_NAME.size
+        names.append(data[offset:offset + n])
+        offset += n
+
+    # A game that died mid-round leaves a partial round at the end; drop it.
+    rounds = []
+    while offset < len(data):
+        moves = []
+        for _ in xrange(nplayers):
+            if offset + TRACE_MOVE.size > len(data):
+                break
+            (x, y, life, plant, move, eat, nimages) = \
+                TRACE_MOVE.unpack_from(data, offset)
+            offset += TRACE_MOVE.size
+            size = nimages * IMAGE_SIZE
+            if offset + size > len(data):
+                break
+            images = np.frombuffer(data, dtype=np.uint8, count=size,
+                                   offset=offset).reshape(nimages, IMAGE_SIZE)
+            offset += size
+            moves.append(Move(x, y, life, plant, move, bool(eat),
+                              images.tolist()))
+        if len(moves) < nplayers:
+            break
+        rounds.append(moves)
+
+    return Trace(params, seed, names, rounds)
+
+class ReplayView:
+    # Plays back one recorded move at a time: load() a Move, then hand this
+    # to the player's get_move.  Images beyond those recorded repeat the last
+    # one (or are blank), and are counted in overruns.
+    def __init__(self, observation_cost, round=0):
+        self.observation_cost = observation_cost
+        self.round = round
+        self.overruns = 0
+        self.load(Move(0, 0, 0, 0, 0, False, []))
+
+    def load(self, move):
+        self.move = move
+        self.served = 0
+
+    def GetXPos(self):
+        return self.move.x
+
+    def GetYPos(self):
+        return self.move.y
+
+    def GetLife(self):
+        return self.move.life - self.served * self.observation_cost
+
+    def GetRound(self):
+        return self.round
+
+    def GetPlantInfo(self):
+        return self.move.plant
+
+    def GetImage(self):
+        images = self.move.images
+        if self.served < len(images):
+            image = images[self.served]
+        else:
+            self.overruns += 1
+            image = images[-1] if images else [0] * IMAGE_SIZE
+        self.served += 1
+        return list(image)
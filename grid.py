@@ -0,0 +1,45 @@
+#
+# grid.py - Array-backed boards shared by the players.
+#
+# A Grid holds one value per cell of the square board [-bounds, bounds]^2 in
+# a typed NumPy array, indexed by (x, y) board positions: one-byte state
+# codes ('S1'), booleans for flags, floats for densities.  `pos in grid` is an
+# O(1) bounds check, and whole-board queries run on the array directly.
+#
+
+import numpy as np
+
+class Grid(object):
+    __slots__ = ('bounds', 'size', 'cells')
+
+    def __init__(self, bounds, dtype, value=None):
+        self.bounds = bounds
+        self.size = 2*bounds + 1
+        self.cells = np.zeros((self.size, self.size), dtype=dtype)
+        if value is not None:
+            self.fill(value)
+
+    def __contains__(self, pos):
+        # Also accepts None, e.g. for a previous position not known yet.
+        if pos is None:
+            return False
+        (x, y) = pos
+        return -self.bounds <= x <= self.bounds and \
+               -self.bounds <= y <= self.bounds
+
+    def index(self, (x, y)):
+        # Array index of board position (x, y).
+        return (x + self.bounds, y + self.bounds)
+
+    def __getitem__(self, pos):
+        if pos not in self:
+            raise IndexError('%r is off the board' % (pos,))
+        return self.cells[pos[0] + self.bounds, pos[1] + self.bounds]
+
+    def __setitem__(self, pos, value):
+        if pos not in self:
+            raise IndexError('%r is off the board' % (pos,))
+        self.cells[pos[0] + self.bounds, pos[1] + self.bounds] = value
+
+    def fill(self, value):
+        self.cells.fill(value)
@@ -0,0 +1,188 @@
+#
+# sweep.py - Parallel hyperparameter sweeps over the nnet/main trainer.
+#
+# Expands a grid (or a random sample of a grid) of epochs, learning rates,
+# hidden layer sizes and sample sizes, and runs one trainer per setting on a
+# process pool.  nnet/main always reads ../data/plants*.dat and writes
+# weights.out to its working directory, so each run gets its own directory
+# under the output directory, next to a data link to the real data.  The
+# accuracies each run prints are collected into a results table, and the
+# weights of the run with the best validation accuracy are kept.
+#
+
+import itertools
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from descender import nnet
+
+TRAINER = os.path.join(ROOT, 'nnet', 'main')
+WEIGHTS_FILE = 'weights.out'
+RESULTS_FILE = 'results.tsv'
+
+def expand(options):
+    # All (epochs, rate, hiddens, samples) settings, or a random sample of
+    # options.random of them.
+    grid = list(itertools.product(options.epochs, options.rates,
+                                  options.hiddens, options.samples))
+    if options.random is not None and options.random < len(grid):
+        grid = random.Random(options.seed).sample(grid, options.random)
+    return grid
+
+def run_dir(options, run):
+    return os.path.join(options.out, 'run-%03d' % run)
+
+def train((options, run, setting)):
+    (epochs, rate, hiddens, samples) = setting
+    cwd = run_dir(options, run)
+    os.makedirs(cwd)
+
+    args = nnet.cxx_args(options.trainer, epochs, rate, hiddens, samples)
+    start = time.time()
+    try:
+        output = subprocess.check_output(args, cwd=cwd,
+                                         stderr=subprocess.STDOUT)
+        performance = nnet.parse_performance(output)
+        error = None if len(performance) == 3 else 'no performance report'
+    except subprocess.CalledProcessError as e:
+        performance = []
+        error = 'exit status %d: %s' % (e.returncode, e.output.strip())
+    except OSError as e:
+        performance = []
+        error = 'cannot run %s: %s' % (args[0], e.strerror)
+
+    return (run, setting, performance, error, time.time() - start)
+
+def format_list(values):
+    return ','.join(str(n) for n in values) if values else '-'
+
+def print_results(results, f=sys.stdout):
+    f.write('run\tepochs\trate\thiddens\tsamples\t'
+            'training\tvalidation\ttest\tsecs\n')
+    for (run, setting, performance, error, secs) in results:
+        (epochs, rate, hiddens, samples) = setting
+        scores = ['%lf' % v for v in performance] if not error \
+                 else ['-', '-', '-']
+        f.write('\t'.join(['%d' % run, '%d' % epochs, '%g' % rate,
+                           format_list(hiddens), format_list(samples)] +
+                          scores + ['%.1f' % secs]) + '\n')
+
+def layer_list(option, opt, value, parser):
+    # Repeatable; '-' stands for no hidden layers, or no sampling.
+    values = [] if value == '-' else [int(n) for n in value.split(',')]
+    getattr(parser.values, option.dest).append(values)
+
+def number_list(convert):
+    def callback(option, opt, value, parser):
+        setattr(parser.values, option.dest,
+                [convert(v) for v in value.split(',') if v])
+    return callback
+
+def main(argv):
+    parser = OptionParser(usage="Usage: python sweep.py [options]",
+                          add_help_option=False)
+    parser.add_option("--help", action="help",
+                      help="show this help message and exit")
+    parser.add_option("-e", dest="epochs", default=[10], type=str,
+                      action="callback", callback=number_list(int),
+                      help="comma-separated epoch counts")
+    parser.add_option("-r", dest="rates", default=[0.1], type=str,
+                      action="callback", callback=number_list(float),
+                      help="comma-separated learning rates")
+    parser.add_option("-h", dest="hiddens", default=[], type=str,
+                      action="callback", callback=layer_list,
+                      help="hidden layer sizes, e.g. 10,10; repeatable")
+    parser.add_option("-s", dest="samples", default=[], type=str,
+                      action="callback", callback=layer_list,
+                      help="S0,S1 sample sizes; repeatable")
+    parser.add_option("--random", dest="random", default=None, type=int,
+                      help="run this many random settings of the grid")
+    parser.add_option("--seed", dest="seed", default=None, type=int,
+                      help="seed of the random search")
+    parser.add_option("-j", dest="processes", default=None, type=int,
+                      help="number of concurrent runs (default: all cores)")
+    parser.add_option("-o", dest="out", default="sweep",
+                      help="output directory")
+    parser.add_option("--data", dest="data", default=os.path.join(ROOT, 'data'),
+                      help="directory holding plants0-2.dat")
+    parser.add_option("--trainer", dest="trainer", default=TRAINER,
+                      help="path to the nnet/main binary")
+    parser.add_option("--keep-runs", dest="keep_runs", action="store_true",
+                      default=False, help="keep every run's directory")
+    (options, args) = parser.parse_args(argv[1:])
+
+    options.hiddens = options.hiddens or [[]]
+    options.samples = options.samples or [[]]
+    for samples in options.samples:
+        if samples and len(samples) != 2:
+            parser.error("Must specify exactly two sample sizes.")
+    if options.random is not None and options.random < 1:
+        parser.error("--random must be at least 1")
+    settings = expand(options)
+    if not settings:
+        parser.error("nothing to sweep: -e and -r need at least one value")
+
+    options.out = os.path.abspath(options.out)
+    options.trainer = os.path.abspath(options.trainer)
+    if not (os.path.isfile(options.trainer) and
+            os.access(options.trainer, os.X_OK)):
+        parser.error("%s is not an executable trainer; build it with "
+                     "make -C nnet main, or pass --trainer" % options.trainer)
+    if os.path.exists(options.out):
+        parser.error("%s already exists" % options.out)
+    os.makedirs(options.out)
+    # Runs read ../data, i.e., this link.
+    os.symlink(os.path.abspath(options.data), os.path.join(options.out, 'data'))
+
+    tasks = [(options, run, s) for (run, s) in enumerate(settings)]
+    print 'Sweeping %d settings' % len(tasks)
+
+    start = time.time()
+    results = []
+    pool = multiprocessing.Pool(options.processes)
+    try:
+        for result in pool.imap_unordered(train, tasks):
+            (run, setting, performance, error, secs) = result
+            if error:
+                print '  run %d failed: %s' % (run, error)
+            else:
+                print '  run %d: validation %lf  (%.1fs)' % (
+                    run, performance[1], secs)
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Best validation accuracy first; failed runs last.
+    results.sort(key=lambda r: (r[3] is not None,
+                                -r[2][1] if not r[3] else 0, r[0]))
+    print
+    print_results(results)
+    with open(os.path.join(options.out, RESULTS_FILE), 'w') as f:
+        print_results(results, f)
+
+    (best, setting, performance, error, secs) = results[0]
+    if error is None:
+        shutil.copy(os.path.join(run_dir(options, best), WEIGHTS_FILE),
+                    os.path.join(options.out, WEIGHTS_FILE))
+        print
+        print 'Best: run %d, validation %lf; weights in %s' % (
+            best, performance[1], os.path.join(options.out, WEIGHTS_FILE))
+
+    if not options.keep_runs:
+        for (run, _, _, _, _) in results:
+            shutil.rmtree(run_dir(options, run))
+    print 'Total time: %.1fs' % (time.time() - start)
+    return 0 if error is None else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
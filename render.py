@@ -0,0 +1,107 @@
+#
+# render.py - Incremental ANSI rendering of the players' debug boards.
+#
+# A BoardRenderer draws one panel of a board (the cells themselves, or, say,
+# a table of numbers beside them) at a fixed place on the terminal.  Each
+# render() diffs the panel's key array, which holds one number per cell that
+# determines how the cell looks, against the previous frame, and emits
+# cursor-positioned updates for the cells that changed only.  It also keeps
+# running counts of the cells' codes from those diffs, so no one has to
+# rescan the board to count them.  Throttle limits how often frames are
+# drawn at all.
+#
+
+import sys
+import timeit
+import numpy as np
+
+CLEAR = '\033[2J'
+
+def move_to(row, col):
+    # Terminal rows and columns count from 1.
+    return '\033[%d;%dH' % (row, col)
+
+class BoardRenderer:
+    def __init__(self, bounds, glyph, top=1, left=1, width=1, y_up=True):
+        # glyph(key, pos) is the string shown for a cell with that key; it
+        # must be width columns wide.  With y_up, row 0 is y = bounds.
+        self.bounds = bounds
+        self.glyph = glyph
+        self.top, self.left, self.width = top, left, width
+        self.y_up = y_up
+        self.shown = None
+        self.codes = None
+        self.counts = {}
+
+    def position(self, (i, j)):
+        return (i - self.bounds, j - self.bounds)
+
+    def cell_at(self, (i, j)):
+        row = (2*self.bounds - j) if self.y_up else j
+        return move_to(self.top + row, self.left + i * self.width)
+
+    def count(self, code):
+        return self.counts.get(code, 0)
+
+    def recount(self, codes):
+        # Update the code counts with the cells that changed since the last
+        # call.
+        if self.codes is None:
+            values, counts = np.unique(codes, return_counts=True)
+            self.counts = dict(zip(values.tolist(), counts.tolist()))
+        else:
+            changed = np.nonzero(codes != self.codes)
+            for (old, new) in zip(self.codes[changed].tolist(),
+                                  codes[changed].tolist()):
+                self.counts[old] -= 1
+                self.counts[new] = self.counts.get(new, 0) + 1
+        self.codes = codes.copy()
+
+    def render(self, keys, marks=None, codes=None):
+        # The escape sequence that brings the panel up to date.  marks maps
+        # positions to keys that override the cells' own for this frame;
+        # codes, if given, are what count() counts.
+        if codes is not None:
+            self.recount(codes)
+
+        keys = np.array(keys)
+        for (pos, key) in (marks or {}).items():
+            (i, j) = (pos[0] + self.bounds, pos[1] + self.bounds)
+            if 0 <= i < keys.shape[0] and 0 <= j < keys.shape[1]:
+                keys[i, j] = key
+
+        if self.shown is None or self.shown.shape != keys.shape:
+            changed = zip(*np.nonzero(np.ones(keys.shape, dtype=bool)))
+        else:
+            changed = zip(*np.nonzero(keys != self.shown))
+        self.shown = keys
+
+        out = []
+        for (i, j) in changed:
+            out.append(self.cell_at((i, j)))
+            out.append(self.glyph(keys[i, j], self.position((i, j))))
+        return ''.join(out)
+
+class Throttle:
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.last = None
+
+    def ready(self, force=False):
+        # Whether it is time for another frame; if so, the frame is due now.
+        now = timeit.default_timer()
+        if not force and self.last is not None and \
+                now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+def status(row, lines):
+    # Lines of text starting at row, each clearing what was there before.
+    return ''.join(move_to(row + k, 1) + line + '\033[K'
+                   for (k, line) in enumerate(lines))
+
+def emit(frame, out=None):
+    out = out or sys.stdout
+    out.write(frame)
+    out.flush()
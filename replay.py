@@ -0,0 +1,128 @@
+#
+# replay.py - Replay recorded games (see gametrace.py) into a player.
+#
+# Feeds a player's get_move the positions, life, plant info and images that
+# one side of a recorded game saw, round after round, through a ReplayView
+# instead of a game engine, and times every move.  The recorded moves drive
+# the game, whatever the player answers; its answers are only compared with
+# them.  So replays of a trace are repeatable and can be profiled offline:
+#
+#   python rg.py -d 0 --trace game.trace ...
+#   python replay.py game.trace --profile
+#
+
+import cProfile
+import importlib
+import os
+import pstats
+import random
+import sys
+import timeit
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import gametrace
+import rg
+
+def replay(player, trace, player_id, seed=None):
+    # Play back the moves of player_id (1 or 2) in trace; returns the move
+    # latencies, how many moves matched the recorded ones, and how many
+    # images the player asked for beyond those recorded.
+    view = gametrace.ReplayView(trace.observation_cost)
+    random.seed(trace.seed if seed is None else seed)
+    anytime = hasattr(player, 'best_move')
+
+    latencies, matches = [], 0
+    for (r, moves) in enumerate(trace.rounds):
+        recorded = moves[player_id - 1]
+        view.load(recorded)
+        view.round = r
+        if anytime:
+            player.best_move, player.deadline = None, None
+
+        start = timeit.default_timer()
+        (mv, eat) = player.get_move(view)
+        latencies.append(timeit.default_timer() - start)
+
+        if (mv, bool(eat)) == (recorded.move, recorded.eat):
+            matches += 1
+
+    return latencies, matches, view.overruns
+
+def report(path, name, latencies, matches, overruns):
+    ms = sorted(1000 * t for t in latencies)
+    total = sum(latencies)
+    print '%s: %s, %d rounds in %.3fs (%.0f moves/s)' % (
+        path, name, len(ms), total, len(ms) / total if total else 0)
+    if ms:
+        print '  latency: mean %.3fms  p50 %.3fms  p95 %.3fms  max %.3fms' % (
+            sum(ms) / len(ms), rg.percentile(ms, 50), rg.percentile(ms, 95),
+            ms[-1])
+    print '  moves matching the trace: %d/%d  extra images: %d' % (
+        matches, len(ms), overruns)
+
+def main(argv):
+    parser = OptionParser(usage="Usage: python replay.py [options] TRACE...")
+    parser.add_option("-p", dest="player_id", default=1, type=int,
+                      help="which side of the game to replay (1 or 2)")
+    parser.add_option("--player", dest="player", default=None,
+                      help="player package to replay into (default: the "
+                           "recorded one)")
+    parser.add_option("-r", "--repeat", dest="repeat", default=1, type=int,
+                      help="replay each trace this many times")
+    parser.add_option("--seed", dest="seed", default=None, type=int,
+                      help="random seed (default: the game's)")
+    parser.add_option("--profile", dest="profile", action="store_true",
+                      default=False, help="profile the replays")
+    parser.add_option("--simulate", action="store_true", dest="simulate",
+                      default=False, help="use the local game simulator's "
+                                          "constants")
+    (options, args) = parser.parse_args(argv[1:])
+
+    if not args:
+        parser.error("no traces given")
+    if options.player_id not in (1, 2):
+        parser.error("-p must be 1 or 2")
+    if options.simulate:
+        rg.use_simulator()
+
+    profile = cProfile.Profile() if options.profile else None
+    stdout = sys.stdout
+
+    for path in args:
+        trace = gametrace.read_trace(path)
+        name = options.player or trace.names[options.player_id - 1]
+        player = importlib.import_module(name + '.player')
+
+        latencies, matches, overruns = [], 0, 0
+        for i in xrange(options.repeat):
+            # Start from scratch, like rg.py does between batch games.
+            rg.reset_players([player])
+
+            # Keep the player's debugging output out of the report.
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                if profile is not None:
+                    profile.enable()
+                (l, m, o) = replay(player, trace, options.player_id,
+                                   options.seed)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                sys.stdout.close()
+                sys.stdout = stdout
+            latencies += l
+            matches += m
+            overruns += o
+
+        report(path, name, latencies, matches, overruns)
+
+    if profile is not None:
+        pstats.Stats(profile, stream=sys.stdout).sort_stats(
+            'cumulative').print_stats(25)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,63 +1,228 @@
-import player1.player
-import player2.player
-import game_interface
+import copy
+import imp
+import importlib
+import json
+import math
+import multiprocessing
+import os
 import random
+import select
 import signal
 import sys
 import time
+import timeit
 import traceback
 from optparse import OptionParser
 
+import gametrace
+
+# Fall back on the local simulator if the real engine isn't installed, so
+# that players and tools importing this module still load; games only run on
+# it with --simulate (see use_engine).
+try:
+  import game_interface
+  simulated = False
+except ImportError:
+  import simulator as game_interface
+  simulated = True
+
+def use_simulator():
+  # Players import game_interface themselves, so alias the simulator under
+  # that name before they are loaded.
+  global game_interface, simulated
+  import simulator
+  game_interface = simulator
+  simulated = True
+  sys.modules['game_interface'] = simulator
+
+if simulated:
+  use_simulator()
+
+def use_engine(parser, options):
+  # Play on the simulator only when --simulate asks for it.
+  if options.simulate:
+    use_simulator()
+  elif simulated:
+    parser.error("the game engine (game_interface) isn't installed; pass "
+                 "--simulate to play on the local simulator")
+
 class TimeoutException(Exception):
   def __init__(self):
     pass
 
-def get_move(view, cmd, options, player_id):
+# Upper edges of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+class LatencyLog:
+  # Per-player move latencies and timeouts, over one or more games.
+  def __init__(self, names):
+    self.names = names
+    self.games = 0
+    self.samples = dict((p, []) for p in names)
+    self.timeouts = dict((p, []) for p in names)
+    self.failures = dict((p, []) for p in names)
+
+  def record(self, player_id, seconds, round, timed_out, game=None):
+    self.samples[player_id].append(seconds)
+    if timed_out:
+      self.timeouts[player_id].append(round if game is None else [game, round])
+
+  def merge(self, other):
+    self.games += other.games
+    for p in self.names:
+      self.samples[p].extend(other.samples[p])
+      self.timeouts[p].extend(other.timeouts[p])
+      self.failures[p].extend(other.failures[p])
+
+  def report(self):
+    players = {}
+    for p, name in self.names.items():
+      ms = sorted(s * 1000 for s in self.samples[p])
+      counts = [0] * (len(LATENCY_BUCKETS) + 1)
+      for t in ms:
+        counts[next((i for i, edge in enumerate(LATENCY_BUCKETS) if t <= edge),
+                    len(LATENCY_BUCKETS))] += 1
+
+      players[str(p)] = {
+        'name': name,
+        'moves': len(ms),
+        'mean_ms': sum(ms) / len(ms) if ms else None,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': ms[-1] if ms else None,
+        'histogram': {'edges_ms': LATENCY_BUCKETS, 'counts': counts},
+        'timeouts': len(self.timeouts[p]),
+        'timeout_rounds': self.timeouts[p],
+        'worker_failures': self.failures[p],
+      }
+    return {'games': self.games, 'players': players}
+
+  def write(self, path):
+    with open(path, 'w') as f:
+      json.dump(self.report(), f, indent=2, sort_keys=True)
+
+def percentile(ordered, q):
+  # Nearest-rank percentile of a sorted list.
+  if not ordered:
+    return None
+  return ordered[max(int(math.ceil(q / 100.0 * len(ordered))) - 1, 0)]
+
+# Anytime protocol: a player module that defines a best_move global opts in.
+# Before each call, rg.py sets best_move to None and deadline to the
+# timeit.default_timer() time at which the move is due; as the player works,
+# it stores its best (move, eat) so far in best_move, and if it overruns the
+# deadline, that move is played instead of a random one.
+def get_move(view, player, options, player_id, log=None, game=None):
   def timeout_handler(signum, frame):
     raise TimeoutException()
+  anytime = hasattr(player, 'best_move')
+  start = timeit.default_timer()
+  if anytime:
+    player.best_move = None
+    player.deadline = start + options.deadline
   signal.signal(signal.SIGALRM, timeout_handler)
-  signal.alarm(1)
   try: 
-    (mv, eat) = cmd(view)
+    # Short deadlines can expire before the call even starts, so arm the
+    # timer inside the try.
+    signal.setitimer(signal.ITIMER_REAL, options.deadline)
+    (mv, eat) = player.get_move(view)
     # Clear the alarm.
-    signal.alarm(0)
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    if log is not None:
+      log.record(player_id, timeit.default_timer() - start, view.GetRound(),
+                 False, game)
   except TimeoutException:
-    # Return a random value
-    # Should probably log this to the interface
-    (mv, eat) = (random.randint(0, 4), False)
-    error_str = 'Error in move selection (%d).' % view.GetRound()
+    if log is not None:
+      log.record(player_id, timeit.default_timer() - start, view.GetRound(),
+                 True, game)
+    if anytime and player.best_move is not None:
+      (mv, eat) = player.best_move
+      error_str = 'Out of time; using best move so far (%d).' % view.GetRound()
+    else:
+      # Return a random value
+      (mv, eat) = (random.randint(0, 4), False)
+      error_str = 'Error in move selection (%d).' % view.GetRound()
     if options.display:
       game_interface.curses_debug(player_id, error_str)
-    else:
+    elif options.verbose:
       print error_str
   return (mv, eat)
 
-def run(options):
-  game = game_interface.GameInterface(options.plant_bonus,
-                                      options.plant_penalty,
-                                      options.observation_cost,
-                                      options.starting_life,
-                                      options.life_per_turn)
+def load_players(options):
+  # Players are packages exposing a player module, e.g. descender.player.  In
+  # self-play, player 2 gets a second copy of the module, so that the two
+  # sides don't share their module state.
+  player1 = importlib.import_module(options.player1 + '.player')
+  if options.player2 != options.player1:
+    return (player1, importlib.import_module(options.player2 + '.player'))
+  return (player1, load_player_copy(options.player2, 'player_2'))
+
+def load_player_copy(package, name, fresh=False):
+  # Another instance of package.player, as package.<name>.  With fresh, an
+  # existing one is reloaded, which reload() can't do, as there is no
+  # package/<name>.py to find.
+  alias = '%s.%s' % (package, name)
+  if fresh or alias not in sys.modules:
+    path = importlib.import_module(package).__path__
+    (f, fname, description) = imp.find_module('player', path)
+    try:
+      imp.load_module(alias, f, fname, description)
+    finally:
+      f.close()
+  return sys.modules[alias]
+
+def new_game(options, seed=None):
+  args = (options.plant_bonus,
+          options.plant_penalty,
+          options.observation_cost,
+          options.starting_life,
+          options.life_per_turn)
+  # Only the simulator can generate its plant field from a seed.
+  if simulated and seed is not None:
+    return game_interface.GameInterface(*args, seed=seed)
+  return game_interface.GameInterface(*args)
+
+def new_log(options):
+  return LatencyLog({1: options.player1, 2: options.player2})
+
+def play(game, player1, player2, options, log=None, seed=None, trace=None):
   player1_view = game.GetPlayer1View()
   player2_view = game.GetPlayer2View()
+  rounds = 0
+  if log is not None:
+    log.games += 1
+  if trace is not None:
+    # Remember what each player sees, for the trace.
+    player1_view = gametrace.RecordingView(player1_view)
+    player2_view = gametrace.RecordingView(player2_view)
 
-  if options.display:
-    if game_interface.curses_init() < 0:
-      return
-    game_interface.curses_draw_board(game)
-  
   # Keep running until one player runs out of life.
   while True:
-    (mv1, eat1) = get_move(player1_view, player1.player.get_move, options, 1)
-    (mv2, eat2) = get_move(player2_view, player2.player.get_move, options, 2)
+    if trace is not None:
+      player1_view.begin()
+      player2_view.begin()
+    if isinstance(player1, PlayerWorker):
+      ((mv1, eat1), (mv2, eat2)) = worker_moves(
+          [player1, player2], [player1_view, player2_view], options, log, seed)
+      if player1.failure or player2.failure:
+        # The failed player forfeits.
+        return (0 if player1.failure else player1_view.GetLife(),
+                0 if player2.failure else player2_view.GetLife(), rounds)
+    else:
+      (mv1, eat1) = get_move(player1_view, player1, options, 1, log, seed)
+      (mv2, eat2) = get_move(player2_view, player2, options, 2, log, seed)
+    if trace is not None:
+      trace.write(player1_view, mv1, eat1)
+      trace.write(player2_view, mv2, eat2)
     # time.sleep(0.1)
 
     game.ExecuteMoves(mv1, eat1, mv2, eat2)
+    rounds += 1
     if options.display:
       game_interface.curses_draw_board(game)
       game_interface.curses_init_round(game)
-    else:
-      pass
+    elif options.verbose:
       print mv1, eat1, mv2, eat2
       print 'Life:', player1_view.GetLife(), player2_view.GetLife()
     # Check whether someone's life is negative.
@@ -65,29 +230,376 @@ def run(options):
     l2 = player2_view.GetLife()
   
     if l1 <= 0 or l2 <= 0:
-      player1.player.print_board((player1_view.GetXPos(), player1_view.GetYPos()))
-      if options.display:
-        winner = 0
-        if l1 < l2:
-          winner = 2
-        else:
-          winner = 1
-        game_interface.curses_declare_winner(winner)
+      return (l1, l2, rounds)
+
+def new_trace(options, path, seed=None):
+  if not path:
+    return None
+  return gametrace.TraceWriter(path, options, [options.player1, options.player2],
+                               seed)
+
+def run(options):
+  # Seed before the players load, as some draw random numbers at import.
+  if options.seed is not None:
+    random.seed(options.seed)
+  if options.workers:
+    (player1, player2) = (PlayerWorker(options.player1, 1, options),
+                          PlayerWorker(options.player2, 2, options))
+  else:
+    (player1, player2) = load_players(options)
+  game = new_game(options, options.seed)
+
+  if options.display:
+    if game_interface.curses_init() < 0:
+      return
+    game_interface.curses_draw_board(game)
+
+  log = new_log(options)
+  trace = new_trace(options, options.trace, options.seed)
+  try:
+    (l1, l2, rounds) = play(game, player1, player2, options, log, trace=trace)
+  finally:
+    if trace is not None:
+      trace.close()
+  if options.latency:
+    log.write(options.latency)
+
+  if hasattr(player1, 'print_board'):
+    player1_view = game.GetPlayer1View()
+    player1.print_board((player1_view.GetXPos(), player1_view.GetYPos()))
+  if options.workers:
+    player1.close()
+    player2.close()
+  if options.display:
+    winner = 0
+    if l1 < l2:
+      winner = 2
+    else:
+      winner = 1
+    game_interface.curses_declare_winner(winner)
+  else:
+    for player in (player1, player2):
+      if getattr(player, 'failure', None):
+        print 'Player %d forfeits: %s' % (player.player_id, player.failure)
+    if l1 == l2:
+      print 'Tie, remaining life: %d v. %d' % (l1, l2)
+    elif l1 < l2:
+      print 'Player 2 wins: %d v. %d' % (l1, l2)
+    else:
+      print 'Player 1 wins: %d v. %d' % (l1, l2)
+  # Wait for input
+  
+  if options.display:
+    sys.stdin.read(1)
+    game_interface.curses_close()
+
+########################################
+# Player workers
+########################################
+
+# With --workers, each player runs in a persistent worker process of its own,
+# which gets a snapshot of its view for every move and sends back its
+# (move, eat).  GetImage() calls are proxied to the real view in the parent.
+# Both players think at the same time, each worker enforces its deadline
+# with its own timer as get_move() does, and the parent gives up on a worker
+# WORKER_GRACE seconds after that.  A worker that misses the grace period or
+# dies has lost its player's state, so its player forfeits the game, and the
+# failure is recorded in the latency log.
+#
+# Messages are tuples; everything after the type tag is for a move sequence
+# number, so that stale replies can be told apart:
+#
+#   parent -> worker:  ('move', seq, (x, y, life, round, plant_info))
+#                      ('image', seq, image, life)
+#                      ('board', pos), ('quit',)
+#   worker -> parent:  ('image', seq)
+#                      ('move', seq, mv, eat, seconds, timed_out)
+#                      ('board',)
+WORKER_GRACE = 1.0
+
+class WorkerView:
+  # The player's view inside a worker.
+  def __init__(self, conn):
+    self.conn = conn
+    self.seq = None
+
+  def load(self, seq, (x, y, life, round, plant_info)):
+    self.seq = seq
+    (self.x, self.y, self.life) = (x, y, life)
+    (self.round, self.plant_info) = (round, plant_info)
+
+  def GetXPos(self):
+    return self.x
+
+  def GetYPos(self):
+    return self.y
+
+  def GetLife(self):
+    return self.life
+
+  def GetRound(self):
+    return self.round
+
+  def GetPlantInfo(self):
+    return self.plant_info
+
+  def GetImage(self):
+    self.conn.send(('image', self.seq))
+    while True:
+      msg = self.conn.recv()
+      # Skip replies to requests cut short by an earlier timeout.
+      if msg[0] == 'image' and msg[1] == self.seq:
+        (image, self.life) = msg[2:]
+        return image
+
+def worker_main(conn, name, player_id, options):
+  # Moves are timed and logged here, where they are computed; the parent
+  # does the printing.
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  # Forked workers would otherwise share the parent's random state; with
+  # --seed, each player gets a stream of its own.
+  random.seed(None if options.seed is None else options.seed + player_id)
+  player = importlib.import_module(name + '.player')
+  log = new_log(options)
+  view = WorkerView(conn)
+
+  while True:
+    msg = conn.recv()
+    if msg[0] == 'move':
+      view.load(msg[1], msg[2])
+      timeouts = len(log.timeouts[player_id])
+      (mv, eat) = get_move(view, player, options, player_id, log)
+      conn.send(('move', msg[1], mv, eat, log.samples[player_id][-1],
+                 len(log.timeouts[player_id]) > timeouts))
+    elif msg[0] == 'board':
+      if hasattr(player, 'print_board'):
+        player.print_board(msg[1])
+      sys.stdout.flush()
+      conn.send(('board',))
+    elif msg[0] == 'quit':
+      return
+
+class PlayerWorker:
+  def __init__(self, name, player_id, options):
+    self.name = name
+    self.player_id = player_id
+    self.options = options
+    self.seq = 0
+    self.failure = None
+    self.start()
+
+  def start(self):
+    # The worker keeps quiet; the parent reports timeouts.
+    options = copy.copy(self.options)
+    options.display, options.verbose = 0, False
+
+    (self.conn, child) = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(
+        target=worker_main, args=(child, self.name, self.player_id, options))
+    self.process.daemon = True
+    self.process.start()
+    child.close()
+
+  def stop(self, reason):
+    self.failure = reason
+    self.process.terminate()
+    self.process.join()
+    self.conn.close()
+
+  def request(self, view):
+    self.seq += 1
+    self.view = view
+    self.started = timeit.default_timer()
+    self.conn.send(('move', self.seq, (view.GetXPos(), view.GetYPos(),
+                                       view.GetLife(), view.GetRound(),
+                                       view.GetPlantInfo())))
+
+  def print_board(self, pos):
+    if self.failure:
+      return
+    self.conn.send(('board', pos))
+    self.conn.recv()
+
+  def close(self):
+    if self.failure:
+      return
+    try:
+      self.conn.send(('quit',))
+    except IOError:
+      pass
+    self.process.join()
+
+def worker_moves(workers, views, options, log=None, game=None):
+  # Ask every worker for its move and serve their image requests until all
+  # of them have answered or run out of time.
+  for (worker, view) in zip(workers, views):
+    worker.request(view)
+
+  moves = {}
+  pending = list(workers)
+  while pending:
+    now = timeit.default_timer()
+    for worker in [w for w in pending
+                   if now > w.started + options.deadline + WORKER_GRACE]:
+      pending.remove(worker)
+      moves[worker] = worker_failed(worker, 'Worker timed out', options, log,
+                                    game)
+
+    ready = select.select([w.conn for w in pending], [], [],
+                          max(min([w.started for w in pending] or [now]) +
+                              options.deadline + WORKER_GRACE - now, 0))[0]
+    for worker in [w for w in pending if w.conn in ready]:
+      try:
+        msg = worker.conn.recv()
+        if msg[0] == 'image':
+          if msg[1] != worker.seq:
+            continue
+          worker.conn.send(('image', msg[1], worker.view.GetImage(),
+                            worker.view.GetLife()))
+          continue
+      except (EOFError, IOError):
+        pending.remove(worker)
+        moves[worker] = worker_failed(worker, 'Worker died', options, log,
+                                      game)
+        continue
+
+      if msg[0] != 'move' or msg[1] != worker.seq:
+        continue
+      (mv, eat, seconds, timed_out) = msg[2:]
+      pending.remove(worker)
+      moves[worker] = (mv, eat)
+
+      if log is not None:
+        log.record(worker.player_id, seconds, worker.view.GetRound(),
+                   timed_out, game)
+      if timed_out:
+        report_error(worker.player_id, 'Out of time (%d).' %
+                     worker.view.GetRound(), options)
+
+  return [moves[w] for w in workers]
+
+def worker_failed(worker, reason, options, log=None, game=None):
+  # Stop the worker; play() ends the game with its player forfeiting.  The
+  # failure is always reported, verbose or not.
+  round = worker.view.GetRound()
+  if log is not None:
+    log.record(worker.player_id, timeit.default_timer() - worker.started,
+               round, True, game)
+    log.failures[worker.player_id].append(
+        [reason, round] if game is None else [game, reason, round])
+  print >>sys.stderr, 'Player %d: %s (%d).' % (worker.player_id, reason, round)
+  worker.stop('%s in round %d' % (reason.lower(), round))
+  # A placeholder; the game ends before this move is played.
+  return (0, False)
+
+def report_error(player_id, error_str, options):
+  if options.display:
+    game_interface.curses_debug(player_id, error_str)
+  elif options.verbose:
+    print error_str
+
+########################################
+# Batch mode
+########################################
+
+def batch_init():
+  # Silence the players' debugging output.
+  sys.stdout = open(os.devnull, 'w')
+
+# Player modules that have played a game in this process.
+played = set()
+
+def reset_players(players):
+  # Workers play many games, so put the players back in their starting state
+  # first.  Players without a reset() hook get their module reloaded instead,
+  # which redoes all of their import-time work.
+  for player in players:
+    if player.__name__ in played:
+      if hasattr(player, 'reset'):
+        player.reset()
+      elif player.__name__.endswith('.player'):
+        reload(player)
       else:
-        if l1 == l2:
-          print 'Tie, remaining life: %d v. %d' % (l1, l2)
-        elif l1 < l2:
-          print 'Player 2 wins: %d v. %d' % (l1, l2)
-        else:
-          print 'Player 1 wins: %d v. %d' % (l1, l2)
-      # Wait for input
-      
-      if options.display:
-        sys.stdin.read(1)
-        game_interface.curses_close()
-
-      
-      break
+        load_player_copy(*player.__name__.rsplit('.', 1), fresh=True)
+    played.add(player.__name__)
+
+def finish_players(players):
+  # Pool workers exit without running atexit hooks, so players that buffer
+  # output, e.g., camera's sample sink, write it out in a finish() hook after
+  # every game.
+  for player in players:
+    if hasattr(player, 'finish'):
+      player.finish()
+
+def batch_game((options, seed)):
+  (player1, player2) = load_players(options)
+  reset_players([player1, player2])
+  random.seed(seed)
+
+  start = time.time()
+  log = new_log(options)
+  trace = new_trace(options, options.trace and
+                    os.path.join(options.trace, 'game-%06d.trace' % seed), seed)
+  game = new_game(options, seed)
+  try:
+    (l1, l2, rounds) = play(game, player1, player2, options, log, seed, trace)
+  except SystemExit:
+    # Players may quit early, e.g., camera once it has swept the board; the
+    # game ends there.  The pool would never hear back from this task if the
+    # exception got out.
+    view = game.GetPlayer1View()
+    (l1, l2, rounds) = (view.GetLife(), game.GetPlayer2View().GetLife(),
+                        view.GetRound())
+  finally:
+    if trace is not None:
+      trace.close()
+    finish_players([player1, player2])
+  return (seed, l1, l2, rounds, time.time() - start, log)
+
+def summarize(values):
+  mean = sum(values) / float(len(values))
+  var = sum((v - mean) ** 2 for v in values) / float(len(values))
+  return (mean, math.sqrt(var), min(values), max(values))
+
+def run_batch(options):
+  first = options.seed or 0
+  seeds = range(first, first + options.games)
+  if options.trace and not os.path.isdir(options.trace):
+    os.makedirs(options.trace)
+  pool = multiprocessing.Pool(options.processes, batch_init)
+
+  start = time.time()
+  try:
+    results = pool.map(batch_game, [(options, s) for s in seeds], chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+  elapsed = time.time() - start
+
+  wins = sum(1 for r in results if r[1] > r[2])
+  ties = sum(1 for r in results if r[1] == r[2])
+  losses = len(results) - wins - ties
+
+  print '%s v. %s: %d games in %.1fs' % (options.player1, options.player2,
+                                         len(results), elapsed)
+  print '  player 1 wins: %d  ties: %d  losses: %d  (win rate %.3f)' % (
+      wins, ties, losses, wins / float(len(results)))
+  print '  life margin:  mean %.2f  std %.2f  min %d  max %d' % summarize(
+      [r[1] - r[2] for r in results])
+  print '  game length:  mean %.2f  std %.2f  min %d  max %d' % summarize(
+      [r[3] for r in results])
+
+  log = new_log(options)
+  for r in results:
+    log.merge(r[5])
+
+  for p, stats in sorted(log.report()['players'].items()):
+    print '  player %s latency: p50 %.2fms  p95 %.2fms  p99 %.2fms  ' \
+          'max %.2fms  timeouts %d' % (p, stats['p50_ms'], stats['p95_ms'],
+                                       stats['p99_ms'], stats['max_ms'],
+                                       stats['timeouts'])
+  if options.latency:
+    log.write(options.latency)
 
 def main(argv):
   parser = OptionParser()
@@ -103,8 +615,44 @@ def main(argv):
                     help="starting life",type=int)
   parser.add_option("--life_per_turn", dest="life_per_turn", default=1,
                     help="life spent per turn",type=int)
+  parser.add_option("--player1", dest="player1", default="player1",
+                    help="package of player 1")
+  parser.add_option("--player2", dest="player2", default="player2",
+                    help="package of player 2")
+  parser.add_option("-n", "--games", dest="games", default=0, type=int,
+                    help="play this many headless games in parallel")
+  parser.add_option("--seed", dest="seed", default=None, type=int,
+                    help="random seed (of the first game, in batch mode)")
+  parser.add_option("--simulate", action="store_true", dest="simulate",
+                    default=False, help="use the local game simulator")
+  parser.add_option("-j", "--processes", dest="processes", default=None,
+                    help="number of batch worker processes", type=int)
+  parser.add_option("--deadline", dest="deadline", default=1.0, type=float,
+                    help="seconds each player has to choose a move")
+  parser.add_option("--latency", dest="latency", default=None,
+                    help="write per-move latency statistics to this JSON file")
+  parser.add_option("--trace", dest="trace", default=None,
+                    help="record a binary trace of the game to this file "
+                         "(in batch mode, of every game to this directory)")
+  parser.add_option("--workers", action="store_true", dest="workers",
+                    default=False, help="run each player in a worker process "
+                                        "of its own, thinking concurrently")
   (options, args) = parser.parse_args()
 
+  use_engine(parser, options)
+
+  # Per-move output is only printed for single headless games.
+  options.verbose = not options.display
+
+  if options.games > 0:
+    if options.workers:
+      parser.error("--workers is for single games; batch games already run "
+                   "in processes of their own")
+    options.display = 0
+    options.verbose = False
+    run_batch(options)
+    return
+
   try:
     run(options)
   except KeyboardInterrupt:
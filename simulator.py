@@ -0,0 +1,301 @@
+#
+# simulator.py - Local stand-in for the game_interface engine.
+#
+# Exposes the same API as game_interface (GameInterface, player views, the
+# STATUS_* and direction constants, and the curses_* display hooks), so
+# rg.py and the players run unchanged on top of it.  Under the hood, every
+# game lives in a GameBatch, which keeps the state of many independent games
+# in NumPy arrays and steps them in lock-step.
+#
+
+import curses
+import numpy as np
+
+UP, DOWN, LEFT, RIGHT, STAY = range(5)
+
+STATUS_NO_PLANT = 0
+STATUS_UNKNOWN_PLANT = 1
+STATUS_NUTRITIOUS_PLANT = 2
+STATUS_POISONOUS_PLANT = 3
+
+# Plants only grow within FIELD_RADIUS of the origin, clumped around a few
+# patches, each of which is mostly nutritious or mostly poisonous.
+FIELD_RADIUS = 40
+FIELD_WIDTH = 2 * FIELD_RADIUS + 1
+NPATCHES = 12
+PATCH_SPREAD = 6.0
+BASE_DENSITY = 0.05
+PATCH_DENSITY = 0.5
+
+# Images are IMAGE_SIZE x IMAGE_SIZE bitmaps: one of NPROTOTYPES prototypes
+# of the plant's kind, with each pixel flipped with probability IMAGE_NOISE.
+IMAGE_SIZE = 6
+IMAGE_PIXELS = IMAGE_SIZE * IMAGE_SIZE
+NPROTOTYPES = 3
+IMAGE_NOISE = 0.2
+
+# Plant codes in GameBatch.plants.
+NO_PLANT, NUTRITIOUS, POISONOUS = 0, 1, 2
+
+MOVES = np.array([(0, 1), (0, -1), (-1, 0), (1, 0), (0, 0)])
+
+class GameBatch:
+    def __init__(self, ngames, plant_bonus, plant_penalty, observation_cost,
+                 starting_life, life_per_turn, seeds=None):
+        self.ngames = ngames
+        self.plant_bonus = plant_bonus
+        self.plant_penalty = plant_penalty
+        self.observation_cost = observation_cost
+        self.life_per_turn = life_per_turn
+
+        if seeds is None:
+            seeds = np.random.randint(0, 2 ** 31 - 1, ngames)
+        self.rngs = [np.random.RandomState(s) for s in seeds]
+
+        shape = (ngames, FIELD_WIDTH, FIELD_WIDTH)
+        self.plants = np.zeros(shape, dtype=np.int8)
+        self.kinds = np.zeros(shape, dtype=np.int8)
+        self.eaten = np.zeros(shape, dtype=bool)
+        self.prototypes = np.zeros((ngames, 3, NPROTOTYPES, IMAGE_PIXELS),
+                                   dtype=np.int8)
+
+        for g, rng in enumerate(self.rngs):
+            self.plants[g], self.kinds[g], self.prototypes[g] = make_field(rng)
+
+        # pos[g, p] is player p's (x, y) in game g.
+        self.pos = np.zeros((ngames, 2, 2), dtype=int)
+        self.life = np.empty((ngames, 2), dtype=int)
+        self.life.fill(starting_life)
+        self.round = np.zeros(ngames, dtype=int)
+
+    def active(self):
+        return np.all(self.life > 0, axis=1)
+
+    def cells(self, player):
+        # Field indices of each game's player, and which are on the field.
+        (x, y) = (self.pos[:, player, 0] + FIELD_RADIUS,
+                  self.pos[:, player, 1] + FIELD_RADIUS)
+        inside = (x >= 0) & (x < FIELD_WIDTH) & (y >= 0) & (y < FIELD_WIDTH)
+        return (np.clip(x, 0, FIELD_WIDTH - 1), np.clip(y, 0, FIELD_WIDTH - 1),
+                inside)
+
+    def ExecuteMoves(self, mv1, eat1, mv2, eat2):
+        # Arguments are scalars or one entry per game.  Finished games are
+        # left alone.
+        games = np.arange(self.ngames)
+        active = self.active()
+        moves = [np.broadcast_to(mv1, self.ngames),
+                 np.broadcast_to(mv2, self.ngames)]
+        eats = [np.broadcast_to(eat1, self.ngames).astype(bool),
+                np.broadcast_to(eat2, self.ngames).astype(bool)]
+
+        # Both players eat before either moves, so that if they share a cell,
+        # both of them get the plant.
+        eaten = []
+        for p in (0, 1):
+            (x, y, inside) = self.cells(p)
+            plant = self.plants[games, x, y]
+            ok = active & eats[p] & inside & (plant != NO_PLANT) & \
+                 ~self.eaten[games, x, y]
+
+            self.life[:, p] += np.where(ok & (plant == NUTRITIOUS),
+                                        self.plant_bonus, 0)
+            self.life[:, p] -= np.where(ok & (plant == POISONOUS),
+                                        self.plant_penalty, 0)
+            eaten.append((games[ok], x[ok], y[ok]))
+
+        for (g, x, y) in eaten:
+            self.eaten[g, x, y] = True
+
+        for p in (0, 1):
+            step = MOVES[np.clip(moves[p], 0, STAY)]
+            self.pos[:, p] += step * active[:, np.newaxis]
+
+        self.life[active] -= self.life_per_turn
+        self.round[active] += 1
+
+    def GetPlantInfo(self, game, player):
+        (x, y) = self.pos[game, player] + FIELD_RADIUS
+        if not (0 <= x < FIELD_WIDTH and 0 <= y < FIELD_WIDTH):
+            return STATUS_NO_PLANT
+
+        plant = self.plants[game, x, y]
+        if plant == NO_PLANT:
+            return STATUS_NO_PLANT
+        if not self.eaten[game, x, y]:
+            return STATUS_UNKNOWN_PLANT
+        if plant == NUTRITIOUS:
+            return STATUS_NUTRITIOUS_PLANT
+        return STATUS_POISONOUS_PLANT
+
+    def GetImage(self, game, player):
+        self.life[game, player] -= self.observation_cost
+
+        (x, y) = self.pos[game, player] + FIELD_RADIUS
+        if 0 <= x < FIELD_WIDTH and 0 <= y < FIELD_WIDTH:
+            plant, kind = self.plants[game, x, y], self.kinds[game, x, y]
+        else:
+            plant, kind = NO_PLANT, 0
+
+        rng = self.rngs[game]
+        noise = rng.random_sample(IMAGE_PIXELS) < IMAGE_NOISE
+        return (self.prototypes[game, plant, kind] ^ noise).tolist()
+
+    def GetView(self, game, player):
+        return PlayerView(self, game, player)
+
+def make_field(rng):
+    # Returns the plant codes, the prototype index of each plant, and the
+    # image prototypes of (no plant, nutritious, poisonous).
+    centers = rng.uniform(-FIELD_RADIUS, FIELD_RADIUS, (NPATCHES, 2))
+    goodness = rng.uniform(0.1, 0.9, NPATCHES)
+
+    ticks = np.arange(-FIELD_RADIUS, FIELD_RADIUS + 1)
+    (xs, ys) = np.meshgrid(ticks, ticks, indexing='ij')
+    d2 = ((xs[..., np.newaxis] - centers[:, 0]) ** 2 +
+          (ys[..., np.newaxis] - centers[:, 1]) ** 2)
+
+    nearest = np.argmin(d2, axis=-1)
+    density = BASE_DENSITY + PATCH_DENSITY * np.exp(
+        -d2.min(axis=-1) / (2 * PATCH_SPREAD ** 2))
+
+    shape = (FIELD_WIDTH, FIELD_WIDTH)
+    has_plant = rng.random_sample(shape) < density
+    good = rng.random_sample(shape) < goodness[nearest]
+
+    plants = np.where(has_plant, np.where(good, NUTRITIOUS, POISONOUS),
+                      NO_PLANT).astype(np.int8)
+    kinds = rng.randint(0, NPROTOTYPES, shape).astype(np.int8)
+
+    prototypes = rng.randint(0, 2, (3, NPROTOTYPES, IMAGE_PIXELS))
+    prototypes[NO_PLANT] = 0
+    return plants, kinds, prototypes.astype(np.int8)
+
+class PlayerView:
+    def __init__(self, batch, game, player):
+        self.batch = batch
+        self.game = game
+        self.player = player
+
+    def GetLife(self):
+        return int(self.batch.life[self.game, self.player])
+
+    def GetXPos(self):
+        return int(self.batch.pos[self.game, self.player, 0])
+
+    def GetYPos(self):
+        return int(self.batch.pos[self.game, self.player, 1])
+
+    def GetRound(self):
+        return int(self.batch.round[self.game])
+
+    def GetPlantInfo(self):
+        return self.batch.GetPlantInfo(self.game, self.player)
+
+    def GetImage(self):
+        return self.batch.GetImage(self.game, self.player)
+
+class GameInterface:
+    def __init__(self, plant_bonus, plant_penalty, observation_cost,
+                 starting_life, life_per_turn, seed=None):
+        self.batch = GameBatch(1, plant_bonus, plant_penalty, observation_cost,
+                               starting_life, life_per_turn,
+                               None if seed is None else [seed])
+        self.player1_view = self.batch.GetView(0, 0)
+        self.player2_view = self.batch.GetView(0, 1)
+
+    def GetPlayer1View(self):
+        return self.player1_view
+
+    def GetPlayer2View(self):
+        return self.player2_view
+
+    def ExecuteMoves(self, mv1, eat1, mv2, eat2):
+        self.batch.ExecuteMoves(mv1, eat1, mv2, eat2)
+
+
+########################################
+# Display
+########################################
+
+screen = None
+
+BOARD_CHARS = {
+    STATUS_NO_PLANT: ' ',
+    STATUS_UNKNOWN_PLANT: '?',
+    STATUS_NUTRITIOUS_PLANT: 'N',
+    STATUS_POISONOUS_PLANT: 'P',
+}
+
+def curses_init():
+    global screen
+    try:
+        screen = curses.initscr()
+    except curses.error:
+        return -1
+    curses.noecho()
+    curses.cbreak()
+    return 0
+
+def curses_close():
+    global screen
+    if screen is not None:
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        screen = None
+
+def curses_draw_board(game):
+    # Draw the field around the origin, as far as the terminal allows.
+    if screen is None:
+        return
+    batch = game.batch
+    (rows, cols) = screen.getmaxyx()
+    (h, w) = (min(rows - 4, FIELD_WIDTH), min(cols - 1, FIELD_WIDTH))
+
+    players = dict(((int(x), int(y)), str(p + 1))
+                   for p, (x, y) in enumerate(batch.pos[0]))
+
+    for row in xrange(h):
+        y = h // 2 - row
+        line = []
+        for col in xrange(w):
+            x = col - w // 2
+            if (x, y) in players:
+                line.append(players[(x, y)])
+                continue
+            (fx, fy) = (x + FIELD_RADIUS, y + FIELD_RADIUS)
+            plant = batch.plants[0, fx, fy]
+            if plant == NO_PLANT:
+                line.append(BOARD_CHARS[STATUS_NO_PLANT])
+            elif not batch.eaten[0, fx, fy]:
+                line.append(BOARD_CHARS[STATUS_UNKNOWN_PLANT])
+            elif plant == NUTRITIOUS:
+                line.append(BOARD_CHARS[STATUS_NUTRITIOUS_PLANT])
+            else:
+                line.append(BOARD_CHARS[STATUS_POISONOUS_PLANT])
+        screen.addstr(row, 0, ''.join(line))
+    screen.refresh()
+
+def curses_init_round(game):
+    if screen is None:
+        return
+    batch = game.batch
+    (rows, _) = screen.getmaxyx()
+    screen.addstr(rows - 4, 0, 'Round %d   Life: %d v. %d   ' % (
+        batch.round[0], batch.life[0, 0], batch.life[0, 1]))
+    screen.refresh()
+
+def curses_debug(player_id, s):
+    if screen is None:
+        return
+    (rows, _) = screen.getmaxyx()
+    screen.addstr(rows - 4 + player_id, 0, 'Player %d: %s' % (player_id, s))
+    screen.refresh()
+
+def curses_declare_winner(winner):
+    if screen is None:
+        return
+    (rows, _) = screen.getmaxyx()
+    screen.addstr(rows - 1, 0, 'Player %d wins!' % winner)
+    screen.refresh()